@@ -0,0 +1,165 @@
+"""AdbClient against a fake adb server speaking the smart-socket wire protocol.
+
+FakeAdbServer listens on a free local port and answers like the real adb
+server: a 4 digit hex length and the request, then OKAY or FAIL (with a
+length-prefixed message). It knows host:devices-l, host-serial:<serial>:get-state,
+host:transport:<serial> and, on a transport, the shell: and exec: services,
+whose raw output is sent until the socket is closed. The script checks the
+client's answers and errors against it, then measures shell round trips.
+Run from the repository root:
+
+    python -m benchmarks.adb_protocol
+"""
+import logging
+import socketserver
+import statistics
+import threading
+import time
+
+from utils.adb import AdbClient, AdbError
+
+DEVICES = {
+    "SIM000": "product:sim model:Simulated device:sim transport_id:1",
+    "192.168.1.20:5555": "product:sim model:Simulated_WiFi device:sim transport_id:2",
+}
+OUTPUTS = {
+    "getprop ro.product.model": "Simulated\n",
+    "cat /proc/loadavg": "0.50 0.40 0.30 1/700 12345\n",
+}
+CALLS = 500
+
+
+class FakeAdbHandler(socketserver.BaseRequestHandler):
+    def read_exact(self, size):
+        data = b""
+        while len(data) < size:
+            chunk = self.request.recv(size - len(data))
+            if not chunk:
+                return None
+            data += chunk
+        return data
+
+    def okay(self, payload=None):
+        self.request.sendall(b"OKAY")
+        if payload is not None:
+            payload = payload.encode()
+            self.request.sendall(b"%04x" % len(payload) + payload)
+
+    def fail(self, message):
+        message = message.encode()
+        self.request.sendall(b"FAIL" + b"%04x" % len(message) + message)
+
+    def handle(self):
+        serial = None
+        while True:
+            header = self.read_exact(4)
+            if header is None:
+                # a pooled socket closed without a request
+                return
+            request = self.read_exact(int(header, 16)).decode()
+            self.server.requests.append(request)
+
+            if request == "host:devices-l":
+                self.okay("".join(f"{device:<22} device {properties}\n" for device, properties in DEVICES.items()))
+                return
+            if request.startswith("host-serial:") and request.endswith(":get-state"):
+                device = request[len("host-serial:"):-len(":get-state")]
+                if device in DEVICES:
+                    self.okay("device")
+                else:
+                    self.fail(f"device '{device}' not found")
+                return
+            if request.startswith("host:transport:"):
+                device = request[len("host:transport:"):]
+                if device not in DEVICES:
+                    self.fail(f"device '{device}' not found")
+                    return
+                # the socket now talks to the device, the next request is a device service
+                self.okay()
+                serial = device
+                continue
+            if request.startswith(("shell:", "exec:")):
+                if serial is None:
+                    self.fail("no devices/emulators found")
+                    return
+                command = request.split(":", 1)[1]
+                if command.startswith("echo "):
+                    output = command[5:] + "\n"
+                else:
+                    output = OUTPUTS.get(command, f"/system/bin/sh: {command.split()[0]}: inaccessible or not found\n")
+                self.okay()
+                self.request.sendall(output.encode())
+                return
+            self.fail(f"unknown host service '{request}'")
+            return
+
+
+class FakeAdbServer(socketserver.ThreadingTCPServer):
+    """Fake adb server on 127.0.0.1 and a free port, serving from a background thread"""
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self):
+        super().__init__(("127.0.0.1", 0), FakeAdbHandler)
+        self.port = self.server_address[1]
+        self.requests = []
+        self.thread = threading.Thread(target=self.serve_forever, daemon=True)
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.shutdown()
+        self.server_close()
+
+
+def check(client, server):
+    devices = client.devices()
+    assert [device["serial"] for device in devices] == list(DEVICES), devices
+    assert devices[0]["model"] == "Simulated" and devices[1]["transport_id"] == "2", devices
+    assert client.get_state("SIM000") == "device"
+    assert client.shell("SIM000", "echo ok") == "ok\n"
+    assert client.shell("SIM000", "getprop ro.product.model") == "Simulated\n"
+    assert client.exec_out("192.168.1.20:5555", "cat /proc/loadavg") == OUTPUTS["cat /proc/loadavg"].encode()
+    assert "inaccessible or not found" in client.shell("SIM000", "nosuchcommand")
+
+    for call in (lambda: client.shell("MISSING", "echo ok"), lambda: client.get_state("MISSING")):
+        try:
+            call()
+        except AdbError as e:
+            assert "not found" in str(e), e
+        else:
+            raise AssertionError("FAIL was not raised as AdbError")
+    try:
+        client.host_query("host:nonsense")
+    except AdbError as e:
+        assert "unknown host service" in str(e), e
+    else:
+        raise AssertionError("FAIL was not raised as AdbError")
+
+    # a device service is always preceded by its transport on the same socket
+    assert server.requests[server.requests.index("shell:echo ok") - 1] == "host:transport:SIM000"
+
+
+def main():
+    logging.disable(logging.WARNING)
+    with FakeAdbServer() as server:
+        client = AdbClient(port=server.port)
+        check(client, server)
+        print(f"protocol checks passed ({len(server.requests)} requests)")
+
+        latencies = []
+        for _ in range(CALLS):
+            start = time.perf_counter()
+            client.shell("SIM000", "echo ok")
+            latencies.append(time.perf_counter() - start)
+        client.close()
+
+    latencies.sort()
+    print(f"{CALLS} shell round trips: median {statistics.median(latencies) * 1e6:.0f} us, "
+          f"p95 {latencies[int(CALLS * 0.95) - 1] * 1e6:.0f} us")
+
+
+if __name__ == "__main__":
+    main()
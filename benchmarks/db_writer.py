@@ -0,0 +1,92 @@
+"""Sustained SQLite insert rate, per-sample connections versus the background writer.
+
+"before" is how samples used to be saved: a new connection per row, one
+INSERT and a commit in the default rollback-journal mode. "after" submits the
+same rows to a DatabaseWriter (one connection, WAL, batched executemany) and
+waits for them to be flushed. Both write to throwaway databases in a
+temporary directory. Run from the repository root:
+
+    python -m benchmarks.db_writer
+"""
+import logging
+import os
+import sqlite3
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+from utils.data import DatabaseWriter, DB_SAMPLE_COLUMNS, UPSERT_DEVICE, db_fields, initialize_database
+
+ROWS = 2000
+
+SAMPLE = {
+    "timestamp": datetime.now(), "device_serial": "SIM000", "model": "Simulated", "connection_type": "USB",
+    "tasks_total": 700, "tasks_running": 1, "mem_total": 7474, "mem_used": 6738, "cpu_cpu": 800,
+    "cpu_user": 12, "cpu_sys": 10, "cpu_idle": 770, "sample_interval": 1.0,
+}
+
+
+def save_per_connection(db_path, row):
+    conn = sqlite3.connect(db_path)
+    placeholders = ", ".join(["?"] * len(DB_SAMPLE_COLUMNS))
+    conn.execute(
+        f"INSERT INTO device_metrics ({', '.join(DB_SAMPLE_COLUMNS)}) VALUES ({placeholders})",
+        tuple(row[column] for column in DB_SAMPLE_COLUMNS)
+    )
+    conn.execute(UPSERT_DEVICE, (row["device_serial"], row["model"], row["connection_type"], row["timestamp"], row["timestamp"]))
+    conn.commit()
+    conn.close()
+
+
+def before(db_path, rows):
+    start = time.perf_counter()
+    for row in rows:
+        save_per_connection(db_path, row)
+    elapsed = time.perf_counter() - start
+    return ROWS / elapsed, 1e6 * elapsed / ROWS
+
+
+def after(db_path, rows):
+    writer = DatabaseWriter(db_path)
+    writer.start()
+    start = time.perf_counter()
+    for row in rows:
+        writer.submit([row])
+    submitted = time.perf_counter() - start
+    writer.flush(timeout=60)
+    elapsed = time.perf_counter() - start
+    writer.stop()
+    stats = writer.get_stats()
+    assert stats["written"] == ROWS, stats
+    return ROWS / elapsed, 1e6 * submitted / ROWS, stats
+
+
+def count_rows(db_path):
+    conn = sqlite3.connect(db_path)
+    count = conn.execute("SELECT COUNT(*) FROM device_metrics").fetchone()[0]
+    conn.close()
+    return count
+
+
+def main():
+    logging.disable(logging.INFO)
+    # one sample per second, (device_serial, timestamp) is the primary key
+    rows = [db_fields(dict(SAMPLE, timestamp=SAMPLE["timestamp"] + timedelta(seconds=i))) for i in range(ROWS)]
+    with tempfile.TemporaryDirectory() as directory:
+        before_path = initialize_database(os.path.join(directory, "before.db"))
+        after_path = initialize_database(os.path.join(directory, "after.db"))
+
+        before_rate, before_latency = before(before_path, rows)
+        after_rate, after_latency, stats = after(after_path, rows)
+        assert count_rows(before_path) == count_rows(after_path) == ROWS
+
+    print(f"{ROWS} rows")
+    print(f"{'':>8} {'rows/s':>10} {'caller us/row':>14}")
+    print(f"{'before':>8} {before_rate:10.0f} {before_latency:14.1f}")
+    print(f"{'after':>8} {after_rate:10.0f} {after_latency:14.1f}")
+    print(f"writer: {stats['batches']} commits, max queue depth {stats['max_queue_depth']}, "
+          f"{stats['backpressure']} backpressure waits, {stats['dropped']} dropped")
+
+
+if __name__ == "__main__":
+    main()
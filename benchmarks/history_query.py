@@ -0,0 +1,83 @@
+"""Time to query a week of 1 s samples for the history view.
+
+A throwaway database gets a week of simulated 1 s CPU samples (with short
+spikes) and its rollups. Each range is queried down to 2000 points with
+query_history, which reads from the table choose_resolution picks; "raw" reads
+the raw rows of the same range for comparison. Also checks the spikes survive
+the downsampling. Run from the repository root:
+
+    python -m benchmarks.history_query
+"""
+import logging
+import os
+import sqlite3
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+import numpy as np
+
+from utils.data import initialize_database, update_rollups, epoch_ms
+from utils.history import query_history
+
+DAYS = 7
+POINTS = 2000
+SPIKE_EVERY = 6 * 3600
+
+
+def populate(db_path, start):
+    rows = DAYS * 24 * 3600
+    timestamps = start + np.arange(rows, dtype=np.int64) * 1000
+    rng = np.random.default_rng(0)
+    cpu = rng.normal(120, 15, rows).clip(0, 800)
+    # a 3 second burst of load every six hours
+    for spike in range(SPIKE_EVERY, rows, SPIKE_EVERY):
+        cpu[spike:spike + 3] = 750
+
+    columns = ['device_serial', 'timestamp', 'cpu_cpu', 'cpu_user', 'mem_used']
+    conn = sqlite3.connect(db_path)
+    with conn:
+        conn.executemany(
+            f"INSERT INTO device_metrics ({', '.join(columns)}) VALUES (?, ?, ?, ?, ?)",
+            (("SIM000", int(t), 800, round(float(c), 2), 5000) for t, c in zip(timestamps, cpu))
+        )
+        conn.execute(
+            "INSERT INTO devices VALUES ('SIM000', 'Simulated', 'USB', ?, ?)", (int(timestamps[0]), int(timestamps[-1]))
+        )
+        update_rollups(conn, {"SIM000": (int(timestamps[0]), int(timestamps[-1]))})
+    conn.close()
+    return rows
+
+
+def timed(**kwargs):
+    start = time.perf_counter()
+    result = query_history("SIM000", ["cpu_user", "mem_used"], **kwargs)
+    return time.perf_counter() - start, result
+
+
+def main():
+    logging.disable(logging.INFO)
+    start = datetime.now().replace(microsecond=0) - timedelta(days=DAYS) + timedelta(minutes=1)
+    with tempfile.TemporaryDirectory() as directory:
+        db_path = initialize_database(os.path.join(directory, "history.db"))
+        rows = populate(db_path, epoch_ms(start))
+        print(f"{rows} rows over {DAYS} days, downsampled to {POINTS} points per metric")
+        print(f"{'range':>8} {'table':>18} {'rows read':>10} {'ms':>8} {'raw ms':>8} {'spikes':>7}")
+
+        for hours in (1, 24, DAYS * 24):
+            end = start + timedelta(hours=hours)
+            elapsed, result = timed(start=start, end=end, points=POINTS, aggregate="max", db_path=db_path)
+            raw_elapsed, raw = timed(start=start, end=end, points=POINTS, resolution="device_metrics", db_path=db_path)
+            assert raw["rows"] >= result["rows"]
+
+            values = result["series"]["cpu_user"][1]
+            assert len(values) <= POINTS
+            spikes = len(range(SPIKE_EVERY, min(rows, hours * 3600 + 1), SPIKE_EVERY))
+            shown = int(np.sum(np.diff((values >= 700).astype(int)) == 1))
+            label = f"{hours}h"
+            print(f"{label:>8} {result['resolution']:>18} {result['rows']:>10} "
+                  f"{elapsed * 1000:8.1f} {raw_elapsed * 1000:8.1f} {shown:>3}/{spikes:<3}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,54 @@
+"""Host CPU cost of MultiDeviceMonitor as devices are added.
+
+Devices are simulated (benchmarks.simulated): the adb round trip is replaced by
+a wait returning a canned `top -n 1` output, so only droic's own scheduling,
+parsing and buffering is measured. Run from the repository root:
+
+    python -m benchmarks.multi_device
+"""
+import logging
+import time
+
+import utils.monitoring as monitoring
+from benchmarks.simulated import install
+
+ADB_LATENCY = 0.02
+INTERVAL = 0.1
+DURATION = 5
+
+
+def measure(adb, device_count):
+    # the devices of the previous run were interrupted when it stopped
+    adb.reset()
+    monitor = monitoring.MultiDeviceMonitor(max_workers=4)
+    states = []
+    for i in range(device_count):
+        controller = monitor.add_device(f"SIM{i:03d}", monitoring_interval=INTERVAL, save_to_local_db=False)
+        states.append(controller.state)
+
+    cpu_start, wall_start = time.process_time(), time.perf_counter()
+    monitor.start()
+    time.sleep(DURATION)
+    monitor.stop()
+    cpu = time.process_time() - cpu_start
+    wall = time.perf_counter() - wall_start
+
+    return cpu / wall, sum(state.total_points for state in states)
+
+
+def main():
+    logging.disable(logging.INFO)
+    adb = install(ADB_LATENCY)
+
+    print(f"{INTERVAL}s interval, {ADB_LATENCY * 1000:.0f}ms simulated adb latency, {DURATION}s per run")
+    print(f"{'devices':>8} {'samples/s':>10} {'host CPU %':>11} {'per device %':>13}")
+    for device_count in (1, 2, 4, 8, 16):
+        cpu_share, samples = measure(adb, device_count)
+        print(
+            f"{device_count:>8} {samples / DURATION:>10.1f} {100 * cpu_share:>11.1f}"
+            f" {100 * cpu_share / device_count:>13.2f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
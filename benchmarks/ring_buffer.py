@@ -0,0 +1,76 @@
+"""Append and read cost of MetricRingBuffer against the previous pd.concat buffer.
+
+Run from the repository root:
+
+    python -m benchmarks.ring_buffer
+"""
+import time
+from datetime import datetime, timedelta
+
+import pandas as pd
+
+from utils.monitoring import MetricRingBuffer
+
+METRICS = ["cpu_cpu", "cpu_user", "cpu_nice", "cpu_sys", "cpu_idle", "cpu_iow", "cpu_irq", "cpu_sirq", "cpu_host"]
+APPENDS = 2000
+READS = 2000
+
+
+def data_points(count):
+    start = datetime.now()
+    return [
+        dict(
+            {name: i % 100 for name in METRICS},
+            timestamp=start + timedelta(seconds=i),
+            device_serial="SERIAL",
+            model="Model",
+        )
+        for i in range(count)
+    ]
+
+
+class DataFrameBuffer:
+    """The previous MonitoringState.add_data_point, one concat per sample"""
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.collected_data = pd.DataFrame()
+
+    def append(self, data):
+        self.collected_data = pd.concat([self.collected_data, pd.DataFrame([data])], ignore_index=True)
+        if len(self.collected_data) > self.capacity:
+            self.collected_data = self.collected_data.iloc[-self.capacity:]
+
+    def read(self):
+        return [self.collected_data["timestamp"]] + [self.collected_data[name] for name in METRICS]
+
+
+def read_ring(buffer):
+    timestamps = buffer.timestamps()
+    return [timestamps] + [buffer.column(name, len(timestamps)) for name in METRICS]
+
+
+def per_call_us(function, calls):
+    start = time.perf_counter()
+    for _ in range(calls):
+        function()
+    return 1e6 * (time.perf_counter() - start) / calls
+
+
+def main():
+    points = data_points(APPENDS)
+    print(f"{'capacity':>9} {'buffer':>10} {'append us':>10} {'read us':>9}")
+    for capacity in (100, 1000, 10000):
+        frame_buffer = DataFrameBuffer(capacity)
+        ring_buffer = MetricRingBuffer(capacity)
+        for name, buffer, read in (
+            ("DataFrame", frame_buffer, frame_buffer.read),
+            ("ring", ring_buffer, lambda: read_ring(ring_buffer)),
+        ):
+            iterator = iter(points)
+            append_us = per_call_us(lambda: buffer.append(next(iterator)), APPENDS)
+            read_us = per_call_us(read, READS)
+            print(f"{capacity:>9} {name:>10} {append_us:>10.1f} {read_us:>9.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+"""Simulated devices shared by the benchmarks, not a benchmark itself.
+
+install() replaces droic's adb calls: a batch takes `latency` seconds and
+returns a canned `top -n 1` output with droic's overhead readings around it,
+unless the device's commands are interrupted meanwhile, like a slow device
+would. Every device has a single transport and no collectors, since there is
+no shell to run them on.
+"""
+import threading
+import time
+
+import utils.monitoring as monitoring
+from utils.manager import ConnectionManager
+
+TOP_OUTPUT = """Tasks: 700 total,   1 running, 699 sleeping,   0 stopped,   0 zombie
+  Mem:  7654321K total,  6900000K used,  400000K free,  12000K buffers
+ Swap:  4000000K total,  1200000K used,  2800000K free,  2000000K cached
+800%cpu  12%user   0%nice  10%sys 770%idle   0%iow   5%irq   3%sirq   0%host
+  PID USER         PR  NI VIRT  RES  SHR S[%CPU] %MEM     TIME+ ARGS
+"""
+
+
+class SimulatedAdb:
+    def __init__(self, latency):
+        self.latency = latency
+        self.lock = threading.Lock()
+        self.interrupted = {}
+
+    def _interrupted(self, device_id):
+        with self.lock:
+            return self.interrupted.setdefault(device_id, threading.Event())
+
+    def run_batch(self, commands, device_id):
+        uptime = time.monotonic()
+        if self._interrupted(device_id).wait(self.latency):
+            return None
+        # droic's shell: uptime before and after, then its /proc/<pid>/stat with 1 jiffy of CPU time
+        return {
+            "overhead_start": f"{uptime:.2f} 0.00",
+            "sample": TOP_OUTPUT,
+            "overhead_end": f"{time.monotonic():.2f} 0.00\n4321 (sh) S 1 4321 4321 0 -1 0 0 0 0 0 1 0 0 0 20 0 1 0",
+        }
+
+    def interrupt_device_commands(self, device_id):
+        self._interrupted(device_id).set()
+
+    def reset(self):
+        """Let the commands of all devices run again after an interrupt"""
+        with self.lock:
+            for interrupted in self.interrupted.values():
+                interrupted.clear()
+
+
+def check_for_better_connection(self, probe_all=False):
+    return False
+
+
+def setup_device_connection(self, selected_device_id=None):
+    if selected_device_id and selected_device_id.startswith("serial:"):
+        serial_number = selected_device_id.split("serial:")[1]
+    else:
+        serial_number = "SIM000"
+    self.device_info["device_id"] = serial_number
+    self.device_info["persistent_id"] = serial_number
+    self.device_info["connection_type"] = "USB"
+    self.device_info["model"] = "Simulated"
+    return True
+
+
+def install(latency):
+    """Simulate every device with `latency` seconds per batch, returns the SimulatedAdb"""
+    adb = SimulatedAdb(latency)
+    monitoring.run_batch = adb.run_batch
+    monitoring.interrupt_device_commands = adb.interrupt_device_commands
+    monitoring.default_collectors = lambda: []
+    ConnectionManager.setup_device_connection = setup_device_connection
+    ConnectionManager.check_for_better_connection = check_for_better_connection
+    return adb
@@ -0,0 +1,65 @@
+"""Latency of stop_monitoring and pause_monitoring over many start/stop cycles.
+
+Devices are simulated: each adb round trip blocks for ADB_LATENCY seconds unless
+the device's commands are interrupted, like a slow Wi-Fi device would. Stopping
+is only fast if the wait is woken and the command in flight is aborted. Run from
+the repository root:
+
+    python -m benchmarks.stop_latency
+"""
+import logging
+import statistics
+import time
+
+import utils.monitoring as monitoring
+from benchmarks.simulated import install
+from utils.manager import ConnectionManager
+
+ADB_LATENCY = 2.0
+INTERVAL = 5
+CYCLES = 200
+
+
+def summarize(name, latencies):
+    latencies = sorted(latencies)
+    p95 = latencies[int(len(latencies) * 0.95) - 1]
+    print(
+        f"{name:>6}: median {statistics.median(latencies) * 1000:7.2f} ms"
+        f"  p95 {p95 * 1000:7.2f} ms  max {latencies[-1] * 1000:7.2f} ms"
+    )
+
+
+def main():
+    logging.disable(logging.WARNING)
+    adb = install(ADB_LATENCY)
+
+    state = monitoring.MonitoringState()
+    state.save_to_local_db = False
+    controller = monitoring.MonitoringController(ConnectionManager(), state)
+
+    stops, pauses = [], []
+    for cycle in range(CYCLES):
+        adb.reset()
+        controller.start_monitoring(monitoring_interval=INTERVAL, collection_mode="top")
+        # alternate between stopping mid-command and stopping while waiting for the next tick
+        time.sleep(0.005 if cycle % 2 else 0.0)
+
+        if cycle % 4 == 0:
+            start = time.perf_counter()
+            controller.pause_monitoring()
+            pauses.append(time.perf_counter() - start)
+            adb.reset()
+            controller.resume_monitoring()
+
+        start = time.perf_counter()
+        controller.stop_monitoring()
+        stops.append(time.perf_counter() - start)
+        assert not controller.state.monitoring_thread.is_alive(), f"monitoring thread still running after cycle {cycle}"
+
+    print(f"{CYCLES} cycles, simulated adb latency {ADB_LATENCY}s, interval {INTERVAL}s")
+    summarize("stop", stops)
+    summarize("pause", pauses)
+
+
+if __name__ == "__main__":
+    main()
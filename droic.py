@@ -1,4 +1,5 @@
 import dash
+import flask
 import logging
 import sys
 import os
@@ -6,8 +7,9 @@ import os
 from utils.manager import ConnectionManager
 from utils.monitoring import MonitoringState
 from utils.monitoring import MonitoringController
+from utils.monitoring import MultiDeviceMonitor
 from ui.callbacks import register_callbacks
-from ui.layout import create_layout
+from ui.layout import HISTORY_PATH, create_app_layout
 
 logging.basicConfig(
     level=logging.INFO,
@@ -21,18 +23,29 @@ logging.basicConfig(
 connection_manager = ConnectionManager()
 monitoring_state = MonitoringState()
 monitoring_controller = MonitoringController(connection_manager, monitoring_state)
+# devices monitored next to the main one, from the "Also monitor" controls
+multi_device_monitor = MultiDeviceMonitor()
 
-# Initialize Dash app
-app = dash.Dash(__name__, update_title=None)
+# Initialize Dash app, pages are swapped in by the url so their components aren't in the initial layout
+app = dash.Dash(__name__, update_title=None, suppress_callback_exceptions=True)
 app.title = "droic"
 
 # Define app layout
-app.layout = create_layout()
+app.layout = create_app_layout()
 
 # Register all callbacks
-notification_manager = register_callbacks(app, connection_manager, monitoring_state, monitoring_controller)
+notification_manager = register_callbacks(
+    app, connection_manager, monitoring_state, monitoring_controller, multi_device_monitor
+)
 monitoring_controller.notification_manager = notification_manager
 
+@app.server.before_request
+def load_history_page():
+    """Register the history page's callbacks when it's first opened, before the browser asks for them"""
+    if flask.request.path == HISTORY_PATH:
+        from ui.history import register_history_callbacks
+        register_history_callbacks(app)
+
 if __name__ == "__main__":
     if os.environ.get("WERKZEUG_RUN_MAIN") == "true":
         logging.info("Starting ADB CPU Monitor Dashboard")
@@ -3,25 +3,38 @@
 # Module: ui.callbacks
 
 import time
+import threading
 import logging
 import dash
+import numpy as np
 import plotly.graph_objs as go
 from dash.dependencies import Input, Output, State
 from dash import html
 
 # from droic
 from utils.adb import get_device_model, get_unique_devices
+from utils.data import database_writer
 from utils.manager import NotificationManager
+from ui.layout import HISTORY_PATH, create_layout
 
 
 def register_callbacks(
-    app, connection_manager, monitoring_state, monitoring_controller
+    app, connection_manager, monitoring_state, monitoring_controller, multi_device_monitor
 ):
     """Register all callbacks for the droidetric dashboard"""
     
     # start a notification manager initially
     notification_manager = NotificationManager()
 
+    @app.callback(Output("page-content", "children"), Input("url", "pathname"))
+    def display_page(pathname):
+        """Show the history page on its path and the live page everywhere else"""
+        if pathname == HISTORY_PATH:
+            # only imported once the page is opened
+            from ui.history import create_history_layout
+            return create_history_layout()
+        return create_layout()
+
     @app.callback(
         Output("connection-status", "children"),
         Output("connection-status", "className"),
@@ -150,6 +163,7 @@ def register_callbacks(
 
     @app.callback(
         Output("device-dropdown", "options"),
+        Output("multi-device-dropdown", "options"),
         [
             Input("device-check-interval", "n_intervals"),
             Input("refresh-button", "n_clicks"),
@@ -180,7 +194,7 @@ def register_callbacks(
             option_text = f"{model} - Serial: {serial_number} ({conn_type_str})"
             options.append({"label": option_text, "value": f"serial:{serial_number}"})
         
-        return options
+        return options, options
 
     @app.callback(
         [Output("device-info", "children"), Output("auto-stopped-state", "children")],
@@ -283,8 +297,10 @@ def register_callbacks(
                                     [
                                         html.Span("Status", className="pill-title"),
                                         html.Span(
-                                            "Active",
-                                            className="pill-value monitoring-status-active",
+                                            "Paused" if monitoring_state.user_paused else "Active",
+                                            className="pill-value monitoring-status-paused"
+                                            if monitoring_state.user_paused
+                                            else "pill-value monitoring-status-active",
                                         ),
                                     ],
                                     className="status-pill",
@@ -311,13 +327,21 @@ def register_callbacks(
                                     ],
                                     className="status-pill",
                                 ),
+                                html.Div(
+                                    [
+                                        html.Span("Overhead", className="pill-title"),
+                                        html.Span(
+                                            latest_overhead(),
+                                            className="pill-value",
+                                        ),
+                                    ],
+                                    className="status-pill",
+                                ),
                                 html.Div(
                                     [
                                         html.Span("Storage", className="pill-title"),
                                         html.Span(
-                                            "Active"
-                                            if monitoring_state.save_to_local_db
-                                            else "Inactive",
+                                            storage_status(),
                                             className="pill-value monitoring-status-active"
                                             if monitoring_state.save_to_local_db
                                             else "pill-value monitoring-status-inactive",
@@ -359,21 +383,104 @@ def register_callbacks(
             # also tries to clear notifications.
             notification_manager.clear_notification()
             # also handle clear data functionality
-            if len(monitoring_state.collected_data) == 0:
+            if len(monitoring_state.buffer) == 0:
                 logging.warning("No data to clear.")
                 notification_manager.set_notification(
                     "No data to clear.", "notification-error", priority=3
                 )
             else:
-                monitoring_state.collected_data.drop(
-                    monitoring_state.collected_data.index, inplace=True
-                )
-                monitoring_state.total_points = 0
-                logging.info("Data cleared.")
+                monitoring_state.clear_data()
                 notification_manager.set_notification(
                     "Data cleared.", "notification-success", priority=3
                 )
             
+    def latest_overhead():
+        """droic's own CPU use on the device for the latest sample, as pill text"""
+        snapshot = monitoring_state.buffer.snapshot
+        if not snapshot.has_column("overhead_cpu_pct"):
+            return "n/a"
+        values = snapshot.column("overhead_cpu_pct")
+        values = values[~np.isnan(values)]
+        return f"{values[-1]:.1f}% CPU" if len(values) else "n/a"
+
+    def storage_status():
+        """Storage pill text, with the database writer's counters while saving"""
+        if not monitoring_state.save_to_local_db:
+            return "Inactive"
+        stats = database_writer.get_stats()
+        status = f"Active, {stats['written']} saved"
+        if stats["queued"]:
+            status += f", {stats['queued']} queued"
+        lost = stats["dropped"] + stats["failed"]
+        if lost:
+            status += f", {lost} lost"
+        return status
+
+    @app.callback(
+        Output("pause-button", "children"),
+        Input("pause-button", "n_clicks"),
+        Input("start-button", "n_clicks"),
+        Input("stop-button", "n_clicks"),
+        prevent_initial_call=True,
+    )
+    def toggle_pause(pause_clicks, start_clicks, stop_clicks):
+        """Pause button callback, pauses or resumes sampling of the active monitoring"""
+        trigger_id = dash.callback_context.triggered[0]["prop_id"].split(".")[0]
+        if trigger_id != "pause-button":
+            # starting and stopping always leave monitoring unpaused
+            return "Pause"
+        if not monitoring_state.monitoring_active:
+            notification_manager.set_notification(
+                "Start monitoring a device first.", "notification-error", priority=3
+            )
+            return "Pause"
+        if monitoring_state.user_paused:
+            monitoring_controller.resume_monitoring()
+            notification_manager.set_notification("Monitoring resumed.", "notification-success", priority=3)
+            return "Pause"
+        monitoring_controller.pause_monitoring()
+        notification_manager.set_notification("Monitoring paused.", "notification-info", priority=3)
+        return "Resume"
+
+    @app.callback(Input("compare-button", "n_clicks"), prevent_initial_call=True)
+    def compare_collection_methods(n_clicks):
+        """Compare button callback"""
+        if not monitoring_state.monitoring_active or monitoring_state.monitoring_paused:
+            notification_manager.set_notification(
+                "Start monitoring a connected device first.", "notification-error", priority=3
+            )
+            return
+        if monitoring_state.comparison_active or monitoring_state.burst_active:
+            notification_manager.set_notification(
+                "Wait for the running comparison or burst capture to finish.", "notification-error", priority=3
+            )
+            return
+        notification_manager.set_notification(
+            "Comparing collection methods, 10s each...", "notification-info", priority=3, duration=40
+        )
+        threading.Thread(target=monitoring_controller.compare_collection_methods, daemon=True).start()
+
+    @app.callback(Input("burst-button", "n_clicks"), prevent_initial_call=True)
+    def capture_burst(n_clicks):
+        """Burst capture button callback"""
+        if not monitoring_state.monitoring_active or monitoring_state.monitoring_paused:
+            notification_manager.set_notification(
+                "Start monitoring a connected device first.", "notification-error", priority=3
+            )
+            return
+        if monitoring_state.burst_active:
+            return
+        if monitoring_state.comparison_active:
+            notification_manager.set_notification(
+                "Wait for the comparison of collection methods to finish.", "notification-error", priority=3
+            )
+            return
+        notification_manager.set_notification(
+            "Capturing a 5s burst at 20 Hz...", "notification-info", priority=3, duration=5
+        )
+        # runs for several seconds, don't hold up the callback
+        threading.Thread(target=monitoring_controller.capture_burst, daemon=True).start()
+
     @app.callback(Input("save-to-db-dropdown", "value"))
     def handle_save_to_db(save_value):
         """Handle save to DB dropdown changes"""
@@ -455,14 +562,28 @@ def register_callbacks(
 
     @app.callback(
         Output("droic-plot", "figure"),
+        Output("plot-version-store", "data"),
         [Input("interval-component", "n_intervals"),
         Input("stop-button", "n_clicks"),
         Input("metric-selector-dropdown", "value"),
         Input("specific-metrics-dropdown", "value")],
         [State("droic-plot", "figure"),
-        State("available-metrics-store", "data")]
+        State("available-metrics-store", "data"),
+        State("plot-version-store", "data")]
     )
-    def update_graph(_, stop_clicks, metric, selected_metrics, current_fig, available_metrics):
+    def update_graph(_, stop_clicks, metric, selected_metrics, current_fig, available_metrics, plot_version):
+        # one consistent view of the live data, published by the monitoring thread
+        snapshot = monitoring_state.buffer.snapshot
+        rendered_version = {
+            "version": snapshot.version,
+            "active": monitoring_state.monitoring_active,
+        }
+
+        # nothing new since this client's last poll
+        trigger_id = dash.callback_context.triggered[0]["prop_id"].split(".")[0]
+        if trigger_id == "interval-component" and plot_version == rendered_version:
+            return dash.no_update, dash.no_update
+
         fig = go.Figure()
 
         if not hasattr(monitoring_state, "last_metric"):
@@ -514,6 +635,12 @@ def register_callbacks(
                 "tasks_zombie",
             ]
             max_default = 100 
+        elif metric == "overhead":
+            all_metrics = [
+                "overhead_cpu_pct",
+                "overhead_wall_ms",
+            ]
+            max_default = 10
         else:
             all_metrics = []
             max_default = 100
@@ -524,10 +651,12 @@ def register_callbacks(
             metrics = all_metrics
 
 
-        if not monitoring_state.collected_data.empty:
+        timestamps = snapshot.timestamps
+
+        if len(timestamps) > 0:
 
             for m in metrics:
-                if m in monitoring_state.collected_data.columns:
+                if snapshot.has_column(m):
 
                     if m.startswith("cpu_"):
                         display_name = m.replace("cpu_", "").capitalize()
@@ -537,13 +666,17 @@ def register_callbacks(
                         display_name = m.replace("swap_", "Swap ").capitalize()
                     elif m.startswith("tasks_"):
                         display_name = m.replace("tasks_", "").capitalize()
+                    elif m == "overhead_cpu_pct":
+                        display_name = "droic CPU %"
+                    elif m == "overhead_wall_ms":
+                        display_name = "droic device time (ms)"
                     else:
                         display_name = m.capitalize()
 
                     fig.add_trace(
                         go.Scatter(
-                            x=monitoring_state.collected_data["timestamp"],
-                            y=monitoring_state.collected_data[m],
+                            x=timestamps,
+                            y=snapshot.column(m),
                             mode="lines+markers",
                             name=display_name,
                         )
@@ -557,13 +690,11 @@ def register_callbacks(
         }
 
 
-        if not monitoring_state.collected_data.empty:
-            valid_metrics = [
-                m for m in metrics if m in monitoring_state.collected_data.columns
-            ]
+        if len(timestamps) > 0:
+            valid_metrics = [m for m in metrics if snapshot.has_column(m)]
             if valid_metrics:
                 calculated_max = (
-                    monitoring_state.collected_data[valid_metrics].max().max() * 1.1
+                    max(np.nanmax(snapshot.column(m), initial=0) for m in valid_metrics) * 1.1
                 )
                 y_max = max(calculated_max, max_default)
             else:
@@ -610,21 +741,15 @@ def register_callbacks(
                     xaxis_range = current_fig["layout"]["xaxis"]["range"]
                     yaxis_range = current_fig["layout"]["yaxis"]["range"]
                 except (KeyError, TypeError):
-                    if not monitoring_state.collected_data.empty:
-                        xaxis_range = [
-                            monitoring_state.collected_data["timestamp"].min(),
-                            monitoring_state.collected_data["timestamp"].max(),
-                        ]
+                    if len(timestamps) > 0:
+                        xaxis_range = [timestamps[0], timestamps[-1]]
                         yaxis_range = [0, y_max]
                     else:
                         xaxis_range = None
                         yaxis_range = [0, y_max]
             else:
-                if not monitoring_state.collected_data.empty:
-                    xaxis_range = [
-                        monitoring_state.collected_data["timestamp"].min(),
-                        monitoring_state.collected_data["timestamp"].max(),
-                    ]
+                if len(timestamps) > 0:
+                    xaxis_range = [timestamps[0], timestamps[-1]]
                     yaxis_range = [0, y_max]
                 else:
                     xaxis_range = None
@@ -643,7 +768,7 @@ def register_callbacks(
                 ),
             )
 
-        return fig
+        return fig, rendered_version
 
 
     @app.callback(
@@ -685,6 +810,11 @@ def register_callbacks(
                 {"label": "Stopped Tasks", "value": "tasks_stopped"},
                 {"label": "Zombie Tasks", "value": "tasks_zombie"},
             ]
+        elif metric_category == "overhead":
+            metrics = [
+                {"label": "droic CPU %", "value": "overhead_cpu_pct"},
+                {"label": "droic Device Time (ms)", "value": "overhead_wall_ms"},
+            ]
         else:
             metrics = []
         
@@ -696,20 +826,25 @@ def register_callbacks(
         Output("start-button", "disabled"),
         Output("stop-button", "disabled"),
         Output("device-dropdown", "disabled"),
-        Output("interval-input", "disabled"),
         Output("refresh-button", "disabled"),
         Output("save-to-db-dropdown", "disabled"),
+        Output("collection-mode-dropdown", "disabled"),
         Output("device-dropdown", "value"),
         [
             Input("start-button", "n_clicks"),
             Input("stop-button", "n_clicks"),
             Input("device-check-interval", "n_intervals"),
         ],
-        [State("interval-input", "value"), State("device-dropdown", "value")],
+        [
+            State("interval-input", "value"),
+            State("device-dropdown", "value"),
+            State("collection-mode-dropdown", "value"),
+            State("sampling-mode-dropdown", "value"),
+        ],
         prevent_initial_call=True,
     )
     def manage_monitoring(
-        start_clicks, stop_clicks, n_intervals, interval_value, selected_device
+        start_clicks, stop_clicks, n_intervals, interval_value, selected_device, collection_mode, sampling_mode
     ):
         ctx = dash.callback_context
         trigger_id = (
@@ -743,13 +878,21 @@ def register_callbacks(
 
 
         if trigger_id == "start-button" and start_clicks > 0:
-            if not monitoring_state.monitoring_active:
+            if selected_device and selected_device.split("serial:")[1] in multi_device_monitor.controllers:
+                notification_manager.set_notification(
+                    "This device is already monitored below, stop it there first.", "notification-error", priority=3
+                )
+            elif not monitoring_state.monitoring_active:
                 try:
                     logging.info("Start Button clicked. Initiate monitoring...")
                     monitoring_state.current_device = selected_device
                     logging.info(f"Device which is selected for monitoring is : {monitoring_state.current_device}")
                     success = monitoring_controller.start_monitoring(
-                        interval=interval_value, selected_device_id=selected_device
+                        interval=interval_value,
+                        selected_device_id=selected_device,
+                        monitoring_interval=interval_value or 5,
+                        collection_mode=collection_mode,
+                        sampling_mode=sampling_mode,
                     )
                     logging.info(f"Monitoring started: {success}")
                 except Exception as e:
@@ -776,4 +919,134 @@ def register_callbacks(
             monitoring_state.monitoring_active,
             selected_device,
         )
+
+    @app.callback(
+        Input("multi-start-button", "n_clicks"),
+        Input("multi-stop-button", "n_clicks"),
+        State("multi-device-dropdown", "value"),
+        State("interval-input", "value"),
+        State("collection-mode-dropdown", "value"),
+        State("sampling-mode-dropdown", "value"),
+        State("save-to-db-dropdown", "value"),
+        prevent_initial_call=True,
+    )
+    def manage_multi_device(start_clicks, stop_clicks, selected_devices, interval_value, collection_mode,
+                            sampling_mode, save_value):
+        """Start or stop monitoring the devices selected in the multi-device dropdown"""
+        if not selected_devices:
+            notification_manager.set_notification(
+                "Select devices to monitor first.", "notification-error", priority=3
+            )
+            return
+        serial_numbers = [device.split("serial:")[1] for device in selected_devices]
+        trigger_id = dash.callback_context.triggered[0]["prop_id"].split(".")[0]
+
+        if trigger_id == "multi-stop-button":
+            for serial_number in serial_numbers:
+                multi_device_monitor.remove_device(serial_number)
+            if not multi_device_monitor.controllers:
+                multi_device_monitor.stop()
+            notification_manager.set_notification(
+                f"Stopped monitoring {', '.join(serial_numbers)}.", "notification-success", priority=3
+            )
+            return
+
+        started, failed = [], []
+        for serial_number in serial_numbers:
+            if monitoring_state.monitoring_active and connection_manager.device_info["persistent_id"] == serial_number:
+                # two collectors on one device would skew each other's samples
+                failed.append(serial_number)
+                continue
+            controller = multi_device_monitor.add_device(
+                serial_number,
+                monitoring_interval=interval_value or 5,
+                collection_mode=collection_mode,
+                save_to_local_db=save_value == "save",
+                sampling_mode=sampling_mode,
+            )
+            (started if controller else failed).append(serial_number)
+        if started:
+            multi_device_monitor.start()
+            notification_manager.set_notification(
+                f"Monitoring {', '.join(started)}.", "notification-success", priority=3
+            )
+        if failed:
+            notification_manager.set_notification(
+                f"Could not monitor {', '.join(failed)}, already monitored above or not connected.",
+                "notification-error", priority=3
+            )
+
+    @app.callback(
+        Output("multi-device-plot", "figure"),
+        Output("multi-device-plot", "style"),
+        Output("multi-device-status", "children"),
+        Input("interval-component", "n_intervals"),
+        Input("specific-metrics-dropdown", "value"),
+        Input("available-metrics-store", "data"),
+    )
+    def update_multi_device_plot(_, selected_metrics, available_metrics):
+        """Plot the live buffers of the devices monitored through the multi-device controls"""
+        controllers = dict(multi_device_monitor.controllers)
+        if not controllers:
+            return dash.no_update, {"height": "400px", "display": "none"}, []
+
+        metrics = selected_metrics or available_metrics or []
+        fig = go.Figure()
+        pills = []
+        for serial_number, controller in controllers.items():
+            snapshot = controller.state.buffer.snapshot
+            for m in metrics:
+                if snapshot.has_column(m):
+                    fig.add_trace(
+                        go.Scatter(
+                            x=snapshot.timestamps,
+                            y=snapshot.column(m),
+                            mode="lines+markers",
+                            name=f"{serial_number} {m}",
+                        )
+                    )
+            status = "Reconnecting" if controller.state.monitoring_paused else f"{len(snapshot.timestamps)} points"
+            pills.append(
+                html.Div(
+                    [
+                        html.Span(serial_number, className="pill-title"),
+                        html.Span(
+                            status,
+                            className="pill-value monitoring-status-paused"
+                            if controller.state.monitoring_paused
+                            else "pill-value monitoring-status-active",
+                        ),
+                    ],
+                    className="status-pill",
+                )
+            )
+
+        fig.update_layout(
+            title="",
+            xaxis_title="Time",
+            legend=dict(
+                orientation="h", yanchor="bottom", y=1.02, xanchor="right", x=1
+            ),
+            margin=dict(l=40, r=40, t=50, b=40),
+            hovermode="closest",
+            template="plotly_white",
+        )
+        return fig, {"height": "400px"}, html.Div(pills, className="pill-row")
+
+    @app.callback(
+        Input("interval-input", "value"),
+        prevent_initial_call=True,
+    )
+    def update_monitoring_interval(interval_value):
+        # the interval stays editable while monitoring, a change applies to the next tick
+        if interval_value and monitoring_state.monitoring_active:
+            monitoring_controller.set_monitoring_interval(interval_value)
+
+    @app.callback(
+        Input("sampling-mode-dropdown", "value"),
+        prevent_initial_call=True,
+    )
+    def update_sampling_mode(sampling_mode):
+        if monitoring_state.monitoring_active:
+            monitoring_controller.set_sampling_mode(sampling_mode)
     return notification_manager
\ No newline at end of file
@@ -0,0 +1,233 @@
+# Author: Davis Thomas Daniel
+# Project: droic
+# Module: ui.history
+
+import logging
+import threading
+from datetime import datetime, timedelta
+
+import dash
+import pandas as pd
+import plotly.graph_objs as go
+from dash import dcc, html
+from dash.dependencies import Input, Output
+from dash.exceptions import PreventUpdate
+
+# from droic
+from utils.history import HISTORY_METRICS, list_devices, query_history
+
+RESOLUTION_LABELS = {
+    'device_metrics': 'raw samples',
+    'device_metrics_1m': '1 minute rollups',
+    'device_metrics_1h': '1 hour rollups',
+}
+
+registration_lock = threading.Lock()
+registered_apps = set()
+
+
+def metric_label(metric):
+    """Readable name of a stored metric, with its category since the plot can mix them"""
+    if metric == 'overhead_cpu_pct':
+        return 'droic CPU %'
+    if metric == 'overhead_wall_ms':
+        return 'droic device time (ms)'
+    if metric == 'sample_interval':
+        return 'Sample interval (s)'
+    category, _, name = metric.partition('_')
+    return f"{category.capitalize()} {name}"
+
+def device_range(device):
+    """First and last day a device has samples on, as date picker strings"""
+    return device['first_seen'].date().isoformat(), device['last_seen'].date().isoformat()
+
+def create_history_layout():
+    devices = list_devices()
+    device_options = [
+        {'label': f"{device['model']} ({device['device_serial']})", 'value': device['device_serial']}
+        for device in devices
+    ]
+    if devices:
+        # the last day of the most recently seen device
+        first_day, last_day = device_range(devices[0])
+    else:
+        first_day = last_day = datetime.now().date().isoformat()
+
+    layout = html.Div([
+        html.Div([
+            html.Img(src='/assets/droic_logo.svg', style={'height': '90px'}),
+        ], style={'textAlign': 'center', 'marginBottom': '20px'}),
+        html.Div([
+            html.Div([
+                html.Label("Device:", style={'marginRight': '10px'}),
+                dcc.Dropdown(
+                    id='history-device-dropdown',
+                    options=device_options,
+                    value=device_options[0]['value'] if device_options else None,
+                    placeholder="No stored samples yet",
+                    clearable=False,
+                    style={'width': '500px', 'marginRight': '20px'}
+                ),
+            ], style={'display': 'flex', 'alignItems': 'center', 'marginBottom': '15px'}),
+
+            html.Div([
+                html.Label("From", style={'marginRight': '2px'}),
+                dcc.DatePickerRange(
+                    id='history-date-range',
+                    start_date=last_day,
+                    end_date=last_day,
+                    min_date_allowed=first_day,
+                    max_date_allowed=last_day,
+                    display_format='YYYY-MM-DD',
+                    style={'marginRight': '5px'}
+                ),
+                html.Label("show", style={'marginRight': '2px'}),
+                # rollups hold min, max, mean and last of every bucket
+                dcc.Dropdown(
+                    id='history-aggregate-dropdown',
+                    options=[
+                        {'label': 'mean', 'value': 'mean'},
+                        {'label': 'max', 'value': 'max'},
+                        {'label': 'min', 'value': 'min'},
+                        {'label': 'last', 'value': 'last'}
+                    ],
+                    value='mean',
+                    clearable=False,
+                    searchable=False,
+                    style={'width': '100px', 'marginRight': '5px'}
+                ),
+                html.Label("of", style={'marginRight': '2px'}),
+                dcc.Dropdown(
+                    id='history-metrics-dropdown',
+                    options=[{'label': metric_label(metric), 'value': metric} for metric in HISTORY_METRICS],
+                    value=['cpu_user', 'cpu_sys'],
+                    multi=True,
+                    style={'width': '500px'}
+                ),
+            ], style={
+                'display': 'flex',
+                'alignItems': 'center',
+                'flexWrap': 'wrap',
+                'gap': '5px',
+                'marginBottom': '20px'
+            }),
+
+            html.Div(id='history-status', style={'marginBottom': '10px'}),
+            dcc.Graph(id='history-plot', style={'height': '500px'}),
+            # the zoomed range and the plot's width in pixels, set in the browser
+            dcc.Store(id='history-view-store')
+        ], style={'padding': '20px'})
+    ], className='dash-container')
+
+    return layout
+
+def visible_range(relayout):
+    """The x range a relayoutData event zoomed or panned to, 'reset' on autorange, None otherwise"""
+    if 'xaxis.range[0]' in relayout and 'xaxis.range[1]' in relayout:
+        return [relayout['xaxis.range[0]'], relayout['xaxis.range[1]']]
+    if 'xaxis.range' in relayout:
+        return relayout['xaxis.range']
+    if relayout.get('xaxis.autorange'):
+        return 'reset'
+    return None
+
+def register_history_callbacks(app):
+    """Register the callbacks of the history page, once per app"""
+    with registration_lock:
+        if id(app) in registered_apps:
+            return
+        registered_apps.add(id(app))
+    logging.info("Loading the history page.")
+
+    # the width decides how many points are worth fetching, only the browser knows it
+    app.clientside_callback(
+        """
+        function(relayoutData) {
+            const graph = document.getElementById('history-plot');
+            return {relayout: relayoutData || {}, width: graph ? graph.offsetWidth : null};
+        }
+        """,
+        Output("history-view-store", "data"),
+        Input("history-plot", "relayoutData"),
+        prevent_initial_call=True
+    )
+
+    @app.callback(
+        Output("history-date-range", "start_date"),
+        Output("history-date-range", "end_date"),
+        Output("history-date-range", "min_date_allowed"),
+        Output("history-date-range", "max_date_allowed"),
+        Input("history-device-dropdown", "value"),
+        prevent_initial_call=True
+    )
+    def update_history_dates(device_serial):
+        """Limit the date range to the days the device has samples on and show its last day"""
+        for device in list_devices():
+            if device['device_serial'] == device_serial:
+                first_day, last_day = device_range(device)
+                return last_day, last_day, first_day, last_day
+        raise PreventUpdate
+
+    @app.callback(
+        Output("history-plot", "figure"),
+        Output("history-status", "children"),
+        Input("history-device-dropdown", "value"),
+        Input("history-date-range", "start_date"),
+        Input("history-date-range", "end_date"),
+        Input("history-metrics-dropdown", "value"),
+        Input("history-aggregate-dropdown", "value"),
+        Input("history-view-store", "data"),
+    )
+    def update_history_plot(device_serial, start_date, end_date, metrics, aggregate, view):
+        """Fetch the visible range of the selected metrics, about one point per pixel"""
+        fig = go.Figure()
+        fig.update_layout(
+            xaxis_title="Time",
+            legend=dict(
+                orientation="h", yanchor="bottom", y=1.02, xanchor="right", x=1
+            ),
+            margin=dict(l=40, r=40, t=50, b=40),
+            hovermode="closest",
+            template="plotly_white",
+        )
+        if not device_serial or not metrics or not start_date or not end_date:
+            return fig, "Select a device, a date range and metrics."
+
+        start = datetime.fromisoformat(start_date[:10])
+        end = datetime.fromisoformat(end_date[:10]) + timedelta(days=1)
+        xaxis_range = None
+        view = view or {}
+        if dash.ctx.triggered_id == "history-view-store":
+            zoomed = visible_range(view.get('relayout', {}))
+            if zoomed is None:
+                # autosize, legend clicks, zooming only the y axis
+                raise PreventUpdate
+            if zoomed != 'reset':
+                xaxis_range = zoomed
+                start, end = (pd.Timestamp(value).to_pydatetime() for value in zoomed)
+
+        points = max(int(view.get('width') or 1000), 100)
+        result = query_history(device_serial, metrics, start, end, points=points, aggregate=aggregate)
+        if result is None:
+            return fig, "Failed to load the history, see the log."
+
+        for metric, (timestamps, values) in result['series'].items():
+            fig.add_trace(
+                go.Scattergl(
+                    x=timestamps,
+                    y=values,
+                    mode="lines",
+                    name=metric_label(metric),
+                )
+            )
+        if xaxis_range:
+            fig.update_layout(xaxis=dict(autorange=False, range=xaxis_range))
+        else:
+            fig.update_layout(xaxis=dict(autorange=True, range=None))
+
+        shown = max((len(values) for _, values in result['series'].values()), default=0)
+        status = (
+            f"{result['rows']} rows of {RESOLUTION_LABELS.get(result['resolution'], result['resolution'])}, "
+            f"showing up to {shown} points per metric."
+        )
+        return fig, status
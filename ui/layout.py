@@ -4,6 +4,20 @@
 
 from dash import dcc, html
 
+HISTORY_PATH = '/history'
+
+def create_app_layout():
+    """Page container, filled with the live page or the history page depending on the URL"""
+    return html.Div([
+        dcc.Location(id='url'),
+        # plain links, a full page load is what registers the history page's callbacks (see droic.py)
+        html.Div([
+            html.A('Live', href='/', style={'marginRight': '15px'}),
+            html.A('History', href=HISTORY_PATH),
+        ], style={'textAlign': 'right', 'padding': '10px 20px 0 0'}),
+        html.Div(id='page-content')
+    ])
+
 def create_layout():
     layout = html.Div([
         # logo
@@ -60,7 +74,35 @@ def create_layout():
                     value=5,
                     style={'width': '50px', 'marginRight': '5px'}
                 ),
-                html.Label("seconds.", style={'marginRight': '5px'}),
+                html.Label("seconds", style={'marginRight': '2px'}),
+                # fixed interval, or adapt it to how much the device's usage changes
+                dcc.Dropdown(
+                    id='sampling-mode-dropdown',
+                    options=[
+                        {'label': 'fixed', 'value': 'fixed'},
+                        {'label': 'adaptive', 'value': 'adaptive'}
+                    ],
+                    value='fixed',
+                    clearable=False,
+                    searchable=False,
+                    style={'width': '100px', 'marginRight': '5px'}
+                ),
+                html.Label("using", style={'marginRight': '2px'}),
+                # how samples are collected from the device
+                dcc.Dropdown(
+                    id='collection-mode-dropdown',
+                    options=[
+                        {'label': 'top', 'value': 'top'},
+                        {'label': 'top stream', 'value': 'stream'},
+                        {'label': '/proc', 'value': 'proc'},
+                        {'label': 'exec-out', 'value': 'exec-out'}
+                    ],
+                    value='top',
+                    clearable=False,
+                    searchable=False,
+                    style={'width': '128px', 'marginRight': '5px'}
+                ),
+                html.Label(".", style={'marginRight': '5px'}),
                 # save to local database
                 dcc.Dropdown(
                     id='save-to-db-dropdown',
@@ -79,7 +121,16 @@ def create_layout():
                             style={'marginRight': '10px'}),
                 html.Button('Stop', id='stop-button', n_clicks=0,
                             disabled=True, style={'marginRight': '10px'}),
+                # suspend sampling without stopping, the label flips to Resume
+                html.Button('Pause', id='pause-button', n_clicks=0,
+                            style={'marginRight': '10px'}),
                 html.Button('Clear', id='clear-button', n_clicks=0,
+                            style={'marginRight': '10px'}),
+                # 5 seconds of 20 Hz CPU samples, buffered on the device
+                html.Button('Burst', id='burst-button', n_clicks=0,
+                            style={'marginRight': '10px'}),
+                # run every collection method for a while and report the cheapest
+                html.Button('Compare', id='compare-button', n_clicks=0,
                             style={'marginRight': '10px'})
             ],
                 style={
@@ -99,12 +150,13 @@ def create_layout():
                     options=[
                         {'label': 'CPU', 'value': 'cpu'},
                         {'label': "Mem", 'value': 'mem'},
-                        {'label': "Tasks", 'value': 'tasks'}
+                        {'label': "Tasks", 'value': 'tasks'},
+                        {'label': "Overhead", 'value': 'overhead'}
                     ],
                     value='cpu',
                     clearable=False,
                     searchable=False,
-                    style={'width': '70px', 'marginRight': '2px'}
+                    style={'width': '100px', 'marginRight': '2px'}
                 ),
                 html.Label("show", style={'marginRight': '10px'}),
                 dcc.Dropdown(
@@ -127,6 +179,33 @@ def create_layout():
             id='specific-metrics-container'),
             # main chart
             dcc.Graph(id='droic-plot', style={'height': '500px'}),
+            # more devices at once, each with its own controller and live buffer
+            html.Div([
+                html.Label("Also monitor", style={'marginRight': '10px'}),
+                dcc.Dropdown(
+                    id='multi-device-dropdown',
+                    options=[],
+                    value=[],
+                    multi=True,
+                    placeholder="Select devices",
+                    style={'width': '500px', 'marginRight': '10px'}
+                ),
+                html.Button('Start', id='multi-start-button', n_clicks=0,
+                            style={'marginRight': '10px'}),
+                html.Button('Stop', id='multi-stop-button', n_clicks=0,
+                            style={'marginRight': '10px'})
+            ],
+                style={
+                'display': 'flex',
+                'alignItems': 'center',
+                'flexWrap': 'wrap',
+                'gap': '5px',
+                'marginTop': '20px',
+                'marginBottom': '20px'
+            },
+                id='multi-device-controls'),
+            html.Div(id='multi-device-status'),
+            dcc.Graph(id='multi-device-plot', style={'height': '400px', 'display': 'none'}),
             dcc.Interval(
                 id='interval-component',
                 interval=1000,
@@ -139,7 +218,9 @@ def create_layout():
                 n_intervals=0
             ),
             html.Div(id='auto-stopped-state', style={'display': 'none'}),
-            dcc.Store(id='available-metrics-store')
+            dcc.Store(id='available-metrics-store'),
+            # version of the live data last rendered in droic-plot
+            dcc.Store(id='plot-version-store')
         ], style={'padding': '20px'})
     ], className='dash-container')
 
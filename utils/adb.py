@@ -1,24 +1,505 @@
 import subprocess
+import socket
+import select
+import threading
+import queue
+import uuid
 import time
 import re
 import logging
 import os
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 
 logging.basicConfig(level=logging.INFO, format="%(name)s: %(asctime)s | %(levelname)s | %(filename)s:%(lineno)s >>> %(message)s", datefmt="%d-%m-%YT%H:%M:%SZ")
 
 
 def run_adb_command(cmd, device_id=None):
     """Run an adb command and return the output."""
+    # talk to the adb server directly when possible, fall back to the adb binary otherwise
+    output = run_native_command(cmd, device_id)
+    if output is not None:
+        return output
+
     base_cmd = ['adb']
     if device_id:
         base_cmd += ['-s', device_id]
     base_cmd += cmd
+    start = time.perf_counter()
     try:
         result = subprocess.run(base_cmd, capture_output=True, text=True, timeout=10)
         return result.stdout.strip()
     except subprocess.TimeoutExpired:
         logging.error(f"Command {cmd} timed out.")
         return None
+    finally:
+        fork_latencies.append(time.perf_counter() - start)
+
+
+# latencies (in seconds) of the fork-per-call path, to compare against shell sessions
+fork_latencies = deque(maxlen=100)
+native_latencies = deque(maxlen=100)
+
+
+class AdbError(Exception):
+    """Raised when the adb server answers a request with FAIL."""
+
+
+class AdbClient:
+    """Client for the adb server's smart-socket protocol (tcp:5037 by default).
+
+    Requests are sent as a 4 digit hex length followed by the request string and
+    answered with OKAY or FAIL. Most services close the socket once they are done,
+    so the pool keeps already connected sockets ready instead of reusing spent ones.
+    """
+    def __init__(self, host='127.0.0.1', port=5037, timeout=10, pool_size=2):
+        self.host = host
+        self.port = port
+        self.timeout = timeout
+        self.pool_size = pool_size
+        self.pool = []
+        self.pool_lock = threading.Lock()
+        # sockets of device services which are still running, per serial
+        self.active = {}
+
+    def _connect(self):
+        sock = socket.create_connection((self.host, self.port), timeout=self.timeout)
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        return sock
+
+    def _refill_pool(self):
+        try:
+            sock = self._connect()
+        except OSError:
+            return
+        with self.pool_lock:
+            if len(self.pool) < self.pool_size:
+                self.pool.append(sock)
+                return
+        sock.close()
+
+    def acquire(self):
+        """Return a connected socket, taken from the pool when one is available."""
+        sock = None
+        with self.pool_lock:
+            while self.pool:
+                candidate = self.pool.pop()
+                # an idle socket which is readable has been closed by the server
+                readable, _, _ = select.select([candidate], [], [], 0)
+                if readable:
+                    candidate.close()
+                    continue
+                sock = candidate
+                break
+            missing = self.pool_size - len(self.pool)
+        for _ in range(missing):
+            refill = threading.Thread(target=self._refill_pool)
+            refill.daemon = True
+            refill.start()
+        return sock or self._connect()
+
+    def close(self):
+        with self.pool_lock:
+            for sock in self.pool:
+                sock.close()
+            self.pool = []
+
+    def _read_exact(self, sock, size):
+        data = b''
+        while len(data) < size:
+            chunk = sock.recv(size - len(data))
+            if not chunk:
+                raise ConnectionError("adb server closed the connection.")
+            data += chunk
+        return data
+
+    def _read_all(self, sock):
+        chunks = []
+        while True:
+            chunk = sock.recv(65536)
+            if not chunk:
+                return b''.join(chunks)
+            chunks.append(chunk)
+
+    def _read_length_prefixed(self, sock):
+        size = int(self._read_exact(sock, 4), 16)
+        return self._read_exact(sock, size).decode(errors='replace')
+
+    def _request(self, sock, request):
+        payload = request.encode()
+        sock.sendall(b'%04x' % len(payload) + payload)
+        status = self._read_exact(sock, 4)
+        if status == b'OKAY':
+            return
+        if status == b'FAIL':
+            raise AdbError(self._read_length_prefixed(sock))
+        raise AdbError(f"Unexpected response {status!r} to {request}")
+
+    def host_query(self, request):
+        """Send a host service request which answers with a length-prefixed string."""
+        sock = self.acquire()
+        try:
+            self._request(sock, request)
+            return self._read_length_prefixed(sock)
+        finally:
+            sock.close()
+
+    def devices(self):
+        """Return a list of dicts (serial, state and the devices-l properties)."""
+        devices = []
+        for line in self.host_query('host:devices-l').splitlines():
+            parts = line.split()
+            if len(parts) < 2:
+                continue
+            device = {'serial': parts[0], 'state': parts[1]}
+            for part in parts[2:]:
+                if ':' in part:
+                    key, value = part.split(':', 1)
+                    device[key] = value
+            devices.append(device)
+        return devices
+
+    def get_state(self, serial):
+        return self.host_query(f'host-serial:{serial}:get-state')
+
+    def connect_device(self, address):
+        return self.host_query(f'host:connect:{address}')
+
+    def open_service(self, serial, service):
+        """Switch a socket to the given device and open a device service on it."""
+        sock = self.acquire()
+        try:
+            self._request(sock, f'host:transport:{serial}')
+            self._request(sock, service)
+        except Exception:
+            sock.close()
+            raise
+        return sock
+
+    def run_service(self, serial, service, timeout=None):
+        """Open a device service and return everything it sends until it closes."""
+        sock = self.open_service(serial, service)
+        if timeout:
+            # for services which stay silent longer than the client timeout
+            sock.settimeout(timeout)
+        with self.pool_lock:
+            self.active.setdefault(serial, set()).add(sock)
+        try:
+            return self._read_all(sock)
+        finally:
+            with self.pool_lock:
+                self.active.get(serial, set()).discard(sock)
+            sock.close()
+
+    def interrupt(self, serial):
+        """Shut down the running device services of a serial, their reads return immediately."""
+        with self.pool_lock:
+            sockets = list(self.active.get(serial, ()))
+        for sock in sockets:
+            try:
+                sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+
+    def shell(self, serial, command):
+        """Run a command through the shell: service, non-interactive so its output is raw as well."""
+        return self.run_service(serial, f'shell:{command}').decode(errors='replace')
+
+    def exec_out(self, serial, command, timeout=None):
+        """Run a command through the exec: service, raw bytes without a pty."""
+        return self.run_service(serial, f'exec:{command}', timeout)
+
+
+adb_client = AdbClient(port=int(os.environ.get('ANDROID_ADB_SERVER_PORT', 5037)))
+
+def run_native_command(cmd, device_id=None):
+    """Run an adb command over the server protocol.
+
+    Returns None if the command is not covered by the native client or the
+    adb server can't be reached, so the caller can fall back to the adb binary.
+    """
+    start = time.perf_counter()
+    try:
+        if cmd == ['devices']:
+            lines = [f"{d['serial']}\t{d['state']}" for d in adb_client.devices()]
+            output = '\n'.join(['List of devices attached'] + lines)
+        elif cmd == ['get-state'] and device_id:
+            output = adb_client.get_state(device_id)
+        elif cmd[0] == 'shell' and len(cmd) > 1 and device_id:
+            output = adb_client.shell(device_id, ' '.join(cmd[1:]))
+        elif cmd[0] == 'tcpip' and len(cmd) == 2 and device_id:
+            output = adb_client.run_service(device_id, f'tcpip:{cmd[1]}').decode(errors='replace')
+        elif cmd[0] == 'connect' and len(cmd) == 2:
+            output = adb_client.connect_device(cmd[1])
+        else:
+            return None
+    except AdbError as e:
+        # same as the adb binary, which prints errors on stderr only
+        logging.debug(f"adb server refused {cmd}: {e}")
+        output = ''
+    except OSError as e:
+        logging.debug(f"adb server not reachable for {cmd}: {e}")
+        return None
+    native_latencies.append(time.perf_counter() - start)
+    return output.strip()
+
+
+def run_exec_out(command, device_id, timeout=10):
+    """Run a command through exec-out (no pty) and return its raw output bytes, None on failure."""
+    try:
+        return adb_client.exec_out(device_id, command, timeout)
+    except AdbError as e:
+        logging.error(f"exec-out {command} failed on {device_id}: {e}")
+        return None
+    except TimeoutError:
+        # the command did run, running it again through the adb binary won't help
+        logging.error(f"Command {command} timed out.")
+        return None
+    except OSError:
+        pass
+
+    try:
+        result = subprocess.run(['adb', '-s', device_id, 'exec-out', command], capture_output=True, timeout=timeout)
+        return result.stdout
+    except subprocess.TimeoutExpired:
+        logging.error(f"Command {command} timed out.")
+        return None
+
+
+class AdbShellSession:
+    """A long-lived `adb shell` pipe to one device.
+
+    Commands are written to the shell's stdin followed by a unique sentinel line,
+    output is read back until the sentinel shows up. The shell is restarted
+    automatically if it dies or a command times out.
+    """
+    def __init__(self, device_id, timeout=10):
+        self.device_id = device_id
+        self.timeout = timeout
+        self.process = None
+        self.lines = None
+        self.lock = threading.Lock()
+        self.started = False
+        self.interrupted = False
+        self.restarts = 0
+        self.latencies = deque(maxlen=100)
+        self.last_latency = None
+
+    def start(self):
+        """Start the adb shell process and a reader thread for its stdout"""
+        self.close()
+        if self.started:
+            self.restarts += 1
+        self.started = True
+        self.interrupted = False
+        logging.debug(f"Starting shell session for {self.device_id}")
+        self.process = subprocess.Popen(
+            ['adb', '-s', self.device_id, 'shell'],
+            stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+            text=True, bufsize=1
+        )
+        self.lines = queue.Queue()
+        reader = threading.Thread(target=self._read_output, args=(self.process, self.lines))
+        reader.daemon = True
+        reader.start()
+
+    def _read_output(self, process, lines):
+        for line in process.stdout:
+            lines.put(line)
+        # signal end of stream
+        lines.put(None)
+
+    def is_alive(self):
+        return self.process is not None and self.process.poll() is None
+
+    def close(self):
+        """Terminate the shell process if it is running"""
+        if self.process is not None:
+            try:
+                self.process.stdin.close()
+            except Exception:
+                pass
+            if self.process.poll() is None:
+                self.process.kill()
+            self.process = None
+
+    def _execute(self, command, timeout):
+        sentinel = f"__droic_{uuid.uuid4().hex}__"
+        self.process.stdin.write(f"{command}; echo; echo {sentinel}\n")
+        self.process.stdin.flush()
+
+        deadline = time.monotonic() + timeout
+        output = []
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise TimeoutError(f"Command {command} timed out.")
+            try:
+                line = self.lines.get(timeout=remaining)
+            except queue.Empty:
+                raise TimeoutError(f"Command {command} timed out.")
+            if line is None:
+                raise ConnectionError(f"Shell session for {self.device_id} closed.")
+            if line.strip() == sentinel:
+                break
+            output.append(line)
+        # drop the newline added before the sentinel
+        return ''.join(output)[:-1]
+
+    def run(self, command, timeout=None):
+        """Run a shell command over the session and return its output, None on failure."""
+        timeout = timeout or self.timeout
+        with self.lock:
+            # a broken pipe gets one restart per call, the device may simply be gone
+            for attempt in range(2):
+                if not self.is_alive():
+                    self.start()
+                start = time.perf_counter()
+                try:
+                    output = self._execute(command, timeout)
+                    self.last_latency = time.perf_counter() - start
+                    self.latencies.append(self.last_latency)
+                    return output.strip()
+                except TimeoutError as e:
+                    # the shell is stuck on the command, restart it on the next call
+                    logging.error(str(e))
+                    self.close()
+                    return None
+                except (ConnectionError, OSError) as e:
+                    self.close()
+                    if self.interrupted:
+                        self.interrupted = False
+                        logging.debug(f"Command {command} on {self.device_id} was interrupted.")
+                        return None
+                    logging.warning(f"Shell session for {self.device_id} failed: {e}")
+            return None
+
+    def interrupt(self):
+        """Abort the command currently running, from another thread.
+
+        Kills the shell, so the waiting run() returns None right away instead
+        of waiting for the command or its timeout.
+        """
+        if not self.lock.locked():
+            # idle, nothing to abort
+            return
+        process, lines = self.process, self.lines
+        if process is not None and process.poll() is None:
+            self.interrupted = True
+            process.kill()
+            # wake the reader side now, the pipe may stay open until the device command exits
+            lines.put(None)
+
+
+# (device id, purpose) -> session
+shell_sessions = {}
+shell_sessions_lock = threading.Lock()
+
+def get_shell_session(device_id, purpose="sample"):
+    """Return the shell session of a device for a purpose, creating it if required.
+
+    Slow probes use a session of their own ("collectors"), a probe timing out
+    then never restarts the shell the samples are taken on.
+    """
+    with shell_sessions_lock:
+        session = shell_sessions.get((device_id, purpose))
+        if session is None:
+            session = AdbShellSession(device_id)
+            shell_sessions[(device_id, purpose)] = session
+        return session
+
+def device_shell_sessions(device_id):
+    """All shell sessions of a device, call with shell_sessions_lock held"""
+    return [session for (session_device_id, _), session in shell_sessions.items() if session_device_id == device_id]
+
+def close_shell_session(device_id):
+    """Close and forget the shell sessions of a device."""
+    with shell_sessions_lock:
+        sessions = [shell_sessions.pop(key) for key in list(shell_sessions) if key[0] == device_id]
+    for session in sessions:
+        session.close()
+
+def interrupt_device_commands(device_id):
+    """Abort whatever droic is currently running on a device, shell sessions and native services"""
+    with shell_sessions_lock:
+        sessions = device_shell_sessions(device_id)
+    for session in sessions:
+        session.interrupt()
+    adb_client.interrupt(device_id)
+
+def run_shell_command(cmd, device_id):
+    """Run a shell command (list of args) on a device over its persistent shell session."""
+    return get_shell_session(device_id).run(' '.join(cmd))
+
+class AdbStream:
+    """Output of a long-running adb command, read line by line as it arrives."""
+    def __init__(self, cmd, device_id):
+        self.cmd = cmd
+        self.device_id = device_id
+        self.process = subprocess.Popen(
+            ['adb', '-s', device_id] + cmd,
+            stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True, bufsize=1
+        )
+        self.output = queue.Queue()
+        reader = threading.Thread(target=self._read_output)
+        reader.daemon = True
+        reader.start()
+
+    def _read_output(self):
+        for line in self.process.stdout:
+            self.output.put(line)
+        self.output.put(None)
+
+    def lines(self, timeout=10):
+        """Yield output lines, ends when the command exits or no line arrives within timeout."""
+        while True:
+            try:
+                line = self.output.get(timeout=timeout)
+            except queue.Empty:
+                logging.warning(f"No output from {self.cmd} on {self.device_id} for {timeout}s.")
+                return
+            if line is None:
+                return
+            yield line
+
+    def close(self):
+        if self.process.poll() is None:
+            self.process.kill()
+            # end lines() now, the pipe may stay open until the device command exits
+            self.output.put(None)
+
+def run_batch(commands, device_id):
+    """Run several shell commands in one round trip over the device's shell session.
+
+    commands is a dict of section name -> command, the result maps each name to
+    the output of its command. Returns None if the batch could not be run at all,
+    which means the device is not reachable.
+    """
+    token = uuid.uuid4().hex
+    # the leading echo keeps a marker on its own line when a command doesn't end with a newline
+    script = '; '.join(f"echo; echo __droic_{token}_{name}__; {command}" for name, command in commands.items())
+    output = get_shell_session(device_id).run(script)
+    if output is None:
+        return None
+
+    results = {}
+    marker = re.compile(rf'^__droic_{token}_(\S+)__$', re.MULTILINE)
+    sections = marker.split(output)
+    # split yields [text before the first marker, name, output, name, output, ...]
+    for name, section in zip(sections[1::2], sections[2::2]):
+        results[name] = section.strip('\n')
+    return results
+
+def get_latency_stats():
+    """Return mean per-command latency (ms) for the fork path and each shell session."""
+    def mean_ms(values):
+        return round(1000 * sum(values) / len(values), 2) if values else None
+
+    stats = {'fork': mean_ms(list(fork_latencies)), 'native': mean_ms(list(native_latencies))}
+    with shell_sessions_lock:
+        for (device_id, purpose), session in shell_sessions.items():
+            stats[device_id if purpose == "sample" else f"{device_id} ({purpose})"] = mean_ms(list(session.latencies))
+    return stats
 
 def get_connected_device():
     """Get the connected USB device."""
@@ -36,44 +517,129 @@ def get_connected_device():
 
 def get_device_serial_number(device_id):
     """ Get the actual serial number of the device. """
-    try:
-        # get serial number
-        result = subprocess.run(
-            ['adb', '-s', device_id, 'shell', 'getprop', 'ro.serialno'],
-            stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True
-        )
-        if result.returncode != 0:
-            logging.error(f"Unable to retrieve retrieving serial number for device {device_id}")
-            return None
-        return result.stdout.strip()
-    except Exception as e:
-        logging.error(f"Exception while retrieving serial number: {e}")
+    serial_number = property_cache.get(device_id).get('ro.serialno')
+    if not serial_number:
+        logging.error(f"Unable to retrieve serial number for device {device_id}")
         return None
+    return serial_number
+
+def parse_getprop(output):
+    """Parse the `[key]: [value]` lines of a full getprop dump into a dict."""
+    properties = {}
+    for match in re.finditer(r'^\[([^\]]+)\]:\s*\[(.*)\]\s*$', output, re.MULTILINE):
+        properties[match.group(1)] = match.group(2)
+    return properties
+
+
+class DevicePropertyCache:
+    """Snapshot of every device's system properties, keyed by transport ID.
+
+    Filled with one full `getprop` dump per transport; properties don't change
+    while a device stays connected, so entries are only dropped when the transport
+    disappears. Cold lookups for several transports run on a bounded thread pool.
+    """
+    def __init__(self, max_workers=4):
+        self.properties = {}
+        self.fetch_locks = {}
+        self.lock = threading.Lock()
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='getprop')
+
+    def get(self, device_id):
+        """Return the property dict of a transport, fetching it on the first call."""
+        properties = self.properties.get(device_id)
+        if properties is not None:
+            return properties
+
+        with self.lock:
+            fetch_lock = self.fetch_locks.setdefault(device_id, threading.Lock())
+        # concurrent callers for the same transport wait for a single dump
+        with fetch_lock:
+            properties = self.properties.get(device_id)
+            if properties is None:
+                properties = parse_getprop(run_shell_command(['getprop'], device_id) or '')
+                if not properties:
+                    # don't cache failures, the device might not be ready yet
+                    return {}
+                self.properties[device_id] = properties
+                logging.debug(f"Cached {len(properties)} properties for {device_id}")
+        return properties
+
+    def prefetch(self, device_ids):
+        """Fill the cache for several transports in parallel."""
+        missing = [device_id for device_id in device_ids if device_id not in self.properties]
+        if len(missing) > 1:
+            list(self.executor.map(self.get, missing))
+        elif missing:
+            self.get(missing[0])
+
+    def invalidate(self, device_id):
+        with self.lock:
+            self.properties.pop(device_id, None)
+            self.fetch_locks.pop(device_id, None)
+
+    def retain(self, device_ids):
+        """Drop the entries of every transport which is not in device_ids."""
+        for device_id in list(self.properties):
+            if device_id not in device_ids:
+                self.invalidate(device_id)
+
+
+property_cache = DevicePropertyCache()
+
+def list_transports():
+    """Return the `adb devices` output, from the adb server directly if it is running."""
+    output = run_native_command(['devices'])
+    if output is not None:
+        return output
 
-def get_unique_devices():
     result = subprocess.run(['adb', 'devices'], stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
-    
+
     # check if adb is installed.
     if result.returncode != 0:
         logging.critical("adb is not installed or not working correctly.")
+        return None
+    return result.stdout
+
+def get_unique_devices():
+    """Return a dict of serial number -> transport IDs for the connected devices.
+
+    Served from the track-devices registry, enumerates with `adb devices` while
+    the registry isn't available.
+    """
+    # give a freshly started registry a moment to receive the first device list
+    if device_registry.start():
+        device_registry.ready.wait(timeout=2)
+    if device_registry.ready.is_set():
+        return device_registry.get_devices()
+    return enumerate_devices()
+
+def enumerate_devices():
+    output = list_transports()
+    if output is None:
         return {}
-    
+
     # parse the output
-    devices = {}
-    lines = result.stdout.strip().split('\n')
-    
+    transports = []
+    lines = output.strip().split('\n')
+
     for line in lines[1:]:
         if line.strip():
             parts = line.split()
             if len(parts) >= 2:
                 serial, status = parts[0], parts[1]
                 if status == 'device':
+                    transports.append(serial)
 
-                    actual_serial = get_device_serial(serial)
-                    if actual_serial:
-                        if actual_serial not in devices:
-                            devices[actual_serial] = []
-                        devices[actual_serial].append(serial)
+    property_cache.retain(transports)
+    property_cache.prefetch(transports)
+
+    devices = {}
+    for serial in transports:
+        actual_serial = get_device_serial(serial)
+        if actual_serial:
+            if actual_serial not in devices:
+                devices[actual_serial] = []
+            devices[actual_serial].append(serial)
     
     # unique devices based on the actual serial number
     logging.debug("Monitoring for unique devices based on serial numbers:")
@@ -87,12 +653,11 @@ def get_unique_devices():
     return devices
 
 def get_device_model(device_id):
-    output = run_adb_command(['shell', 'getprop', 'ro.product.model'], device_id)
-    return output.strip() if output else 'Unknown'
+    return property_cache.get(device_id).get('ro.product.model') or 'Unknown'
 
 def get_device_ip(device_id):
-    output = run_adb_command(['shell', 'ip', 'addr', 'show', 'wlan0'], device_id)
-    match = re.search(r'inet\s+(\d+\.\d+\.\d+\.\d+)', output)
+    output = run_shell_command(['ip', 'addr', 'show', 'wlan0'], device_id)
+    match = re.search(r'inet\s+(\d+\.\d+\.\d+\.\d+)', output or '')
     return match.group(1) if match else None
 
 def connect_wifi_adb(device_id, ip, port=5555):
@@ -108,8 +673,115 @@ def connect_wifi_adb(device_id, ip, port=5555):
     return False
 
 def get_device_serial(device_id):
-    output = run_adb_command(['shell', 'getprop', 'ro.serialno'], device_id)
-    return output.strip() if output else None
+    return property_cache.get(device_id).get('ro.serialno') or None
+
+class DeviceRegistry:
+    """Keeps the connected devices up to date from the adb server's host:track-devices stream.
+
+    The server sends the full transport list whenever it changes, the registry
+    resolves the serial number of new transports once and keeps a serial -> transports
+    map which is cheap to read. Listeners are called with (event, serial, device_id)
+    where event is 'connected' or 'disconnected'.
+    """
+    def __init__(self, client, retry_interval=1):
+        self.client = client
+        self.retry_interval = retry_interval
+        self.devices = {}
+        self.transport_serials = {}
+        self.listeners = []
+        self.ready = threading.Event()
+        self.lock = threading.Lock()
+        self.thread = None
+        self.sock = None
+        self.running = False
+
+    def start(self):
+        """Start tracking in a background thread, returns False if it is already running."""
+        with self.lock:
+            if self.running:
+                return False
+            self.running = True
+            self.thread = threading.Thread(target=self._track_devices)
+            self.thread.daemon = True
+            self.thread.start()
+            return True
+
+    def stop(self):
+        self.running = False
+        self.ready.clear()
+        if self.sock:
+            self.sock.close()
+
+    def add_listener(self, callback):
+        self.listeners.append(callback)
+
+    def remove_listener(self, callback):
+        if callback in self.listeners:
+            self.listeners.remove(callback)
+
+    def get_devices(self):
+        """Return the current serial -> transport IDs map (do not modify it)."""
+        return self.devices
+
+    def get_transports(self, serial_number):
+        return self.devices.get(serial_number, [])
+
+    def _track_devices(self):
+        while self.running:
+            try:
+                self.sock = self.client.acquire()
+                self.sock.settimeout(None)
+                self.client._request(self.sock, 'host:track-devices')
+                logging.info("Tracking devices through the adb server.")
+                while self.running:
+                    self._update(self.client._read_length_prefixed(self.sock))
+                    self.ready.set()
+            except (OSError, AdbError) as e:
+                logging.debug(f"Device tracking interrupted: {e}")
+            finally:
+                if self.sock:
+                    self.sock.close()
+            # the map goes stale without the stream, callers fall back to enumeration
+            self.ready.clear()
+            time.sleep(self.retry_interval)
+
+    def _update(self, payload):
+        transports = set()
+        for line in payload.splitlines():
+            parts = line.split()
+            if len(parts) >= 2 and parts[1] == 'device':
+                transports.add(parts[0])
+
+        events = []
+        for device_id in list(self.transport_serials):
+            if device_id not in transports:
+                events.append(('disconnected', self.transport_serials.pop(device_id), device_id))
+                close_shell_session(device_id)
+                property_cache.invalidate(device_id)
+        property_cache.prefetch([d for d in transports if d not in self.transport_serials])
+        for device_id in transports:
+            if device_id not in self.transport_serials:
+                actual_serial = get_device_serial(device_id)
+                if actual_serial:
+                    self.transport_serials[device_id] = actual_serial
+                    events.append(('connected', actual_serial, device_id))
+
+        devices = {}
+        for device_id, actual_serial in self.transport_serials.items():
+            devices.setdefault(actual_serial, []).append(device_id)
+        # readers get either the old or the new map, never a partial one
+        self.devices = devices
+
+        for event, actual_serial, device_id in events:
+            logging.info(f"Device {actual_serial} {event} ({device_id})")
+            for listener in list(self.listeners):
+                try:
+                    listener(event, actual_serial, device_id)
+                except Exception as e:
+                    logging.error(f"Device listener failed: {e}")
+
+
+device_registry = DeviceRegistry(adb_client)
 
 def check_initial_devices():
     try:
@@ -2,7 +2,11 @@ import re
 import os
 import sqlite3
 import logging
-from datetime import datetime
+import queue
+import threading
+import time
+import atexit
+from datetime import datetime, timedelta
 
 def remove_ansi_escape_codes(text):
     ansi_escape = re.compile(r'\x1B(?:[@-Z\\-_]|\[[0-?]*[ -/]*[@-~])')
@@ -20,6 +24,23 @@ def parse_top_memory(value_str):
     else:
         return int(value_str)
 
+def iter_top_frames(lines):
+    """Group the output lines of a continuous `top -d` into frames.
+
+    A frame is yielded as soon as its four summary lines have arrived, the
+    process table that follows is skipped.
+    """
+    frame = None
+    for line in lines:
+        line = remove_ansi_escape_codes(line).strip()
+        if line.startswith('Tasks:'):
+            frame = [line]
+        elif frame is not None:
+            frame.append(line)
+            if len(frame) == 4:
+                yield frame
+                frame = None
+
 def parse_top_summary(lines, device_serial=None):
     data = {}
     if len(lines) < 4:
@@ -57,106 +78,762 @@ def parse_top_summary(lines, device_serial=None):
         logging.error(f"Parsing failed: {e}")
         return None
 
+def parse_proc_snapshot(output):
+    """Parse the concatenated output of /proc/stat, /proc/meminfo and /proc/loadavg.
+
+    Returns the raw counters, CPU jiffies are turned into percentages by
+    compute_proc_metrics using two consecutive snapshots.
+    """
+    snapshot = {'cpu': None, 'cores': 0, 'meminfo': {}, 'procs_running': None, 'loadavg': None}
+    for line in output.splitlines():
+        parts = line.split()
+        if not parts:
+            continue
+        if parts[0] == 'cpu':
+            snapshot['cpu'] = [int(value) for value in parts[1:]]
+        elif re.match(r'cpu\d+$', parts[0]):
+            snapshot['cores'] += 1
+        elif parts[0] == 'procs_running':
+            snapshot['procs_running'] = int(parts[1])
+        elif parts[0].endswith(':') and len(parts) >= 2 and parts[1].isdigit():
+            snapshot['meminfo'][parts[0][:-1]] = int(parts[1])
+        elif len(parts) == 5 and '/' in parts[3]:
+            snapshot['loadavg'] = [float(value) for value in parts[:3]]
+
+    if snapshot['cpu'] is None or not snapshot['meminfo']:
+        logging.error("Incomplete /proc output.")
+        return None
+    return snapshot
+
+def cpu_percentages(previous, current, cores=1):
+    """Turn two readings of the /proc/stat cpu line into top's cpu_* percentages, None if they went backwards"""
+    # user nice system idle iowait irq softirq steal, guest time is part of user
+    labels = ['user', 'nice', 'sys', 'idle', 'iow', 'irq', 'sirq', 'host']
+    deltas = [curr - prev for prev, curr in zip(previous[:8], current[:8])]
+    total = sum(deltas)
+    if total <= 0 or any(delta < 0 for delta in deltas):
+        return None
+
+    data = {'cpu_cpu': 100 * cores}
+    for label, delta in zip(labels, deltas):
+        data[f'cpu_{label}'] = round(100 * cores * delta / total, 2)
+    return data
+
+def compute_proc_metrics(previous, current, device_serial=None):
+    """Build a data point from two /proc snapshots, with the same keys as parse_top_summary.
+
+    CPU values follow top's convention of 100% per core, memory is in MB and
+    swap in KB. Returns None if the counters went backwards (device rebooted).
+    """
+    data = cpu_percentages(previous['cpu'], current['cpu'], current['cores'] or 1)
+    if data is None:
+        return None
+
+    meminfo = current['meminfo']
+    mem_total = meminfo.get('MemTotal', 0)
+    mem_free = meminfo.get('MemFree', 0)
+    data['mem_total'] = round(mem_total / 1024, 2)
+    data['mem_used'] = round((mem_total - mem_free) / 1024, 2)
+    data['mem_free'] = round(mem_free / 1024, 2)
+    data['mem_buffers'] = round(meminfo.get('Buffers', 0) / 1024, 2)
+
+    swap_total = meminfo.get('SwapTotal', 0)
+    swap_free = meminfo.get('SwapFree', 0)
+    data['swap_total'] = swap_total
+    data['swap_used'] = swap_total - swap_free
+    data['swap_free'] = swap_free
+    data['swap_cached'] = meminfo.get('Cached', 0)
+
+    if current['procs_running'] is not None:
+        data['tasks_running'] = current['procs_running']
+    if current['loadavg']:
+        data['load_1'], data['load_5'], data['load_15'] = current['loadavg']
+
+    data['timestamp'] = datetime.now()
+    if device_serial:
+        data['device_serial'] = device_serial
+    return data
+
+def parse_burst_output(output):
+    """Split the output of a burst capture into frames of /proc/uptime followed by /proc/stat.
+
+    Returns a list of dicts with the uptime and the cpu line of the whole CPU
+    and of every core, frames without a cpu line are dropped.
+    """
+    frames = []
+    frame = None
+    for line in output.splitlines():
+        parts = line.split()
+        if len(parts) == 2 and not parts[0].startswith('cpu'):
+            # /proc/uptime starts a new frame
+            try:
+                frame = {'uptime': float(parts[0]), 'cpu': None, 'cores': {}}
+            except ValueError:
+                continue
+            frames.append(frame)
+        elif frame is None or not parts:
+            continue
+        elif parts[0] == 'cpu':
+            frame['cpu'] = [int(value) for value in parts[1:]]
+        elif re.match(r'cpu\d+$', parts[0]):
+            frame['cores'][int(parts[0][3:])] = [int(value) for value in parts[1:]]
+    return [frame for frame in frames if frame['cpu'] is not None]
+
+def compute_burst_metrics(frames, start_time, device_serial=None):
+    """Build data points from consecutive burst frames.
+
+    Besides the cpu_* values of compute_proc_metrics every point has the busy
+    percentage of each core (cpu_core0, cpu_core1, ...) and the time since the
+    previous frame as sample_interval. Timestamps are start_time plus the
+    device uptime elapsed since the first frame.
+    """
+    points = []
+    for previous, current in zip(frames, frames[1:]):
+        data = cpu_percentages(previous['cpu'], current['cpu'], len(current['cores']) or 1)
+        if data is None:
+            continue
+        for core, counters in current['cores'].items():
+            if core not in previous['cores']:
+                # core came online during the burst
+                continue
+            core_data = cpu_percentages(previous['cores'][core], counters)
+            if core_data is not None:
+                data[f'cpu_core{core}'] = round(100 - core_data['cpu_idle'], 2)
+        data['sample_interval'] = round(current['uptime'] - previous['uptime'], 3)
+        data['timestamp'] = start_time + timedelta(seconds=current['uptime'] - frames[0]['uptime'])
+        if device_serial:
+            data['device_serial'] = device_serial
+        points.append(data)
+    return points
+
+def parse_overhead(start_output, end_output):
+    """Parse the /proc/uptime read before droic's commands and the /proc/uptime and /proc/<shell pid>/stat read after them.
+
+    Returns the shell's pid, the device uptime around the commands and the CPU
+    jiffies of the shell including its finished children (utime, stime,
+    cutime, cstime), None if the output is incomplete.
+    """
+    try:
+        uptime_start = float(start_output.split()[0])
+        uptime_line, stat_line = end_output.strip().splitlines()[:2]
+        # the command name in parentheses may contain spaces
+        fields = stat_line[stat_line.rindex(')') + 2:].split()
+        return {
+            'pid': int(stat_line.split()[0]),
+            'uptime_start': uptime_start,
+            'uptime_end': float(uptime_line.split()[0]),
+            'jiffies': sum(int(value) for value in fields[11:15]),
+        }
+    except (ValueError, IndexError):
+        logging.error("Incomplete overhead output.")
+        return None
+
+def compute_overhead(previous, current, cumulative=True):
+    """Device-side cost of collecting a sample, from two parse_overhead readings.
+
+    cumulative readings come from a long-lived shell, the CPU spent since the
+    previous reading of the same shell is the delta; otherwise the reading
+    covers a single command. overhead_cpu_pct is that CPU time relative to
+    the time since the previous sample (100% = one core), overhead_wall_ms
+    how long the commands took on the device. /proc reports in 1/100 s.
+    """
+    data = {'overhead_wall_ms': round(1000 * (current['uptime_end'] - current['uptime_start']), 1)}
+    if not cumulative:
+        jiffies = current['jiffies']
+    elif previous is not None and previous['pid'] == current['pid']:
+        jiffies = current['jiffies'] - previous['jiffies']
+    else:
+        # a new shell, nothing to compare with yet
+        return data
+
+    data['overhead_cpu_ms'] = jiffies * 10
+    if previous is not None:
+        elapsed = current['uptime_end'] - previous['uptime_end']
+        if elapsed > 0:
+            data['overhead_cpu_pct'] = round(jiffies / elapsed, 2)
+    return data
+
+def parse_thermal_zones(output):
+    """Parse `cat /sys/class/thermal/thermal_zone*/temp` (millidegrees) into the hottest zone in °C"""
+    temperatures = [int(line) / 1000 for line in output.split() if line.lstrip('-').isdigit()]
+    if not temperatures:
+        return None
+    return {'thermal_max': max(temperatures), 'thermal_zones': len(temperatures)}
+
+def parse_dumpsys_battery(output):
+    """Parse level, temperature (°C) and voltage (mV) from `dumpsys battery`"""
+    data = {}
+    for key, value in re.findall(r'^\s*(level|temperature|voltage):\s*(-?\d+)', output, re.MULTILINE):
+        data[f'battery_{key}'] = int(value) / 10 if key == 'temperature' else int(value)
+    return data or None
+
+def parse_dumpsys_meminfo(output):
+    """Parse the total PSS (KB) of a package from `dumpsys meminfo <package>`"""
+    match = re.search(r'^\s*TOTAL(?: PSS:)?\s+(\d+)', output, re.MULTILINE)
+    return {'pss_total': int(match.group(1))} if match else None
+
 # database functions
-def initialize_database():
-    """Create or open the SQLite database and initialize the required tables"""
+def initialize_database(db_path=None):
+    """Create or open the SQLite database and initialize the required tables.
+
+    A device_metrics table of the old layout (TEXT timestamps, one row id) is
+    renamed to device_metrics_legacy and migrated in the background.
+    """
 
-    root_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
-    db_path = os.path.join(root_dir, 'droic.db')
+    if db_path is None:
+        root_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+        db_path = os.path.join(root_dir, 'droic.db')
 
     logging.info(f"Database path: {db_path}")
 
     conn = sqlite3.connect(db_path)
     cursor = conn.cursor()
 
-    cursor.execute('''
+    # pruning frees pages with incremental_vacuum, which needs auto_vacuum set before any table exists
+    if cursor.execute("SELECT COUNT(*) FROM sqlite_master").fetchone()[0] == 0:
+        cursor.execute("PRAGMA auto_vacuum = INCREMENTAL")
+    elif cursor.execute("PRAGMA auto_vacuum").fetchone()[0] == 0:
+        # rebuilding a large database would hold up the start, leave it to the user
+        logging.warning(
+            f"{db_path} was created without incremental vacuum, pruned rows won't shrink the file. "
+            f"Run 'PRAGMA auto_vacuum = INCREMENTAL; VACUUM;' on it once while droic is not running."
+        )
+
+    columns = [row[1] for row in cursor.execute("PRAGMA table_info(device_metrics)")]
+    if 'id' in columns:
+        logging.info("Found device_metrics of the old layout, renaming it to device_metrics_legacy.")
+        cursor.execute("ALTER TABLE device_metrics RENAME TO device_metrics_legacy")
+
+    metric_columns = ',\n        '.join(
+        [f'{column} INTEGER' for column in DB_METRIC_COLUMNS]
+        + [f'{column} {column_type}' for column, column_type in DB_OPTIONAL_COLUMNS.items()]
+    )
+    # clustered on (device, time): history queries by device and time range are a range scan
+    cursor.execute(f'''
     CREATE TABLE IF NOT EXISTS device_metrics (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        timestamp TEXT NOT NULL,
         device_serial TEXT NOT NULL,
+        timestamp INTEGER NOT NULL,
+        {metric_columns},
+        PRIMARY KEY (device_serial, timestamp)
+    ) WITHOUT ROWID
+    ''')
+
+    # databases created by older versions lack the columns added since
+    columns = [row[1] for row in cursor.execute("PRAGMA table_info(device_metrics)")]
+    for column, column_type in DB_OPTIONAL_COLUMNS.items():
+        if column not in columns:
+            cursor.execute(f"ALTER TABLE device_metrics ADD COLUMN {column} {column_type}")
+
+    rollup_columns = ',\n        '.join(f'{column} REAL' for column in ROLLUP_COLUMNS)
+    for table, _ in ROLLUPS:
+        # timestamp is the start of the bucket, last_timestamp that of its latest sample
+        cursor.execute(f'''
+        CREATE TABLE IF NOT EXISTS {table} (
+            device_serial TEXT NOT NULL,
+            timestamp INTEGER NOT NULL,
+            samples INTEGER NOT NULL,
+            last_timestamp INTEGER NOT NULL,
+            {rollup_columns},
+            PRIMARY KEY (device_serial, timestamp)
+        ) WITHOUT ROWID
+        ''')
+        # rollups created by older versions lack the per column counts
+        columns = [row[1] for row in cursor.execute(f"PRAGMA table_info({table})")]
+        for column in ROLLUP_COLUMNS:
+            if column not in columns:
+                cursor.execute(f"ALTER TABLE {table} ADD COLUMN {column} REAL")
+
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS devices (
+        device_serial TEXT PRIMARY KEY,
         model TEXT,
         connection_type TEXT,
-        tasks_total INTEGER,
-        tasks_running INTEGER,
-        tasks_sleeping INTEGER,
-        tasks_stopped INTEGER,
-        tasks_zombie INTEGER,
-        mem_total INTEGER,
-        mem_used INTEGER,
-        mem_free INTEGER,
-        mem_buffers INTEGER,
-        swap_total INTEGER,
-        swap_used INTEGER,
-        swap_free INTEGER,
-        swap_cached INTEGER,
-        cpu_cpu INTEGER,
-        cpu_user INTEGER,
-        cpu_nice INTEGER,
-        cpu_sys INTEGER,
-        cpu_idle INTEGER,
-        cpu_iow INTEGER,
-        cpu_irq INTEGER,
-        cpu_sirq INTEGER,
-        cpu_host INTEGER
+        first_seen INTEGER,
+        last_seen INTEGER
+    )
+    ''')
+
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS migrations (
+        name TEXT PRIMARY KEY,
+        last_id INTEGER NOT NULL DEFAULT 0,
+        done INTEGER NOT NULL DEFAULT 0
     )
     ''')
 
     conn.commit()
+    legacy = cursor.execute(
+        "SELECT name FROM sqlite_master WHERE type = 'table' AND name = 'device_metrics_legacy'"
+    ).fetchone()
     conn.close()
+
+    if legacy:
+        # resumes where it stopped, samples keep being written meanwhile
+        migration = threading.Thread(target=migrate_legacy_metrics, args=(db_path,), name="db-migration")
+        migration.daemon = True
+        migration.start()
+
     logging.info("Database initialized successfully.")
     return db_path
 
-def save_data_to_db(data_point):
-    """Save a single data point to the SQLite database"""
-    db_path = DATABASE_PATH
+def migrate_legacy_metrics(db_path, chunk_size=5000):
+    """Copy device_metrics_legacy into the new tables, chunk by chunk, then drop it.
 
+    Rows are read in id order, chunk_size at a time, and every chunk is
+    committed together with the last id it reached, so an interrupted
+    migration continues from there. Old timestamps only have seconds; rows of
+    a device within the same second are spread over its milliseconds in id
+    order, which keeps them distinct and the migration repeatable.
+    """
+    conn = sqlite3.connect(db_path, timeout=30)
     try:
-        conn = sqlite3.connect(db_path)
         cursor = conn.cursor()
+        cursor.execute("INSERT OR IGNORE INTO migrations (name) VALUES ('device_metrics_legacy')")
+        conn.commit()
+        last_id, = cursor.execute("SELECT last_id FROM migrations WHERE name = 'device_metrics_legacy'").fetchone()
 
-        fields = {
-            'timestamp': data_point['timestamp'].strftime('%Y-%m-%d %H:%M:%S'),
-            'device_serial': data_point.get('device_serial', 'unknown'),
-            'model': data_point.get('model', 'Unknown'),
-            'connection_type': data_point.get('connection_type', 'Unknown'),
-            'tasks_total': data_point.get('tasks_total', 0),
-            'tasks_running': data_point.get('tasks_running', 0),
-            'tasks_sleeping': data_point.get('tasks_sleeping', 0),
-            'tasks_stopped': data_point.get('tasks_stopped', 0),
-            'tasks_zombie': data_point.get('tasks_zombie', 0),
-            'mem_total': data_point.get('mem_total', 0),
-            'mem_used': data_point.get('mem_used', 0),
-            'mem_free': data_point.get('mem_free', 0),
-            'mem_buffers': data_point.get('mem_buffers', 0),
-            'swap_total': data_point.get('swap_total', 0),
-            'swap_used': data_point.get('swap_used', 0),
-            'swap_free': data_point.get('swap_free', 0),
-            'swap_cached': data_point.get('swap_cached', 0),
-            'cpu_cpu': data_point.get('cpu_cpu', 0),
-            'cpu_user': data_point.get('cpu_user', 0),
-            'cpu_nice': data_point.get('cpu_nice', 0),
-            'cpu_sys': data_point.get('cpu_sys', 0),
-            'cpu_idle': data_point.get('cpu_idle', 0),
-            'cpu_iow': data_point.get('cpu_iow', 0),
-            'cpu_irq': data_point.get('cpu_irq', 0),
-            'cpu_sirq': data_point.get('cpu_sirq', 0),
-            'cpu_host': data_point.get('cpu_host', 0)
-        }
+        legacy_columns = {row[1] for row in cursor.execute("PRAGMA table_info(device_metrics_legacy)")}
+        values = [
+            column if column in legacy_columns else 'NULL'
+            for column in DB_METRIC_COLUMNS + list(DB_OPTIONAL_COLUMNS)
+        ]
+        select = (
+            f"SELECT id, device_serial, timestamp, model, connection_type, {', '.join(values)} "
+            f"FROM device_metrics_legacy WHERE id > ? ORDER BY id LIMIT ?"
+        )
+        insert = (
+            f"INSERT OR IGNORE INTO device_metrics ({', '.join(DB_SAMPLE_COLUMNS)}) "
+            f"VALUES ({', '.join(['?'] * len(DB_SAMPLE_COLUMNS))})"
+        )
 
-        columns = ', '.join(fields.keys())
-        placeholders = ', '.join(['?'] * len(fields))
-        values = tuple(fields.values())
+        # per device, the second of its last row and how many rows that second had so far
+        seconds = {}
+        resumed_at = last_id
 
-        query = f"INSERT INTO device_metrics ({columns}) VALUES ({placeholders})"
-        cursor.execute(query, values)
+        migrated = 0
+        while True:
+            rows = cursor.execute(select, (last_id, chunk_size)).fetchall()
+            if not rows:
+                break
 
-        conn.commit()
+            samples = []
+            devices = []
+            ranges = {}
+            for row in rows:
+                row_id, serial, timestamp, model, connection_type = row[:5]
+                second, offset = seconds.get(serial, (None, 0))
+                if second == timestamp:
+                    offset += 1
+                elif serial not in seconds and resumed_at:
+                    # the second may have started before the migration was interrupted
+                    offset = cursor.execute(
+                        "SELECT COUNT(*) FROM device_metrics_legacy WHERE device_serial = ? AND timestamp = ? AND id <= ?",
+                        (serial, timestamp, row_id)
+                    ).fetchone()[0]
+                else:
+                    offset = 1
+                seconds[serial] = (timestamp, offset)
+                epoch = epoch_ms(datetime.strptime(timestamp, '%Y-%m-%d %H:%M:%S')) + offset - 1
+                samples.append((serial, epoch) + tuple(row[5:]))
+                devices.append((serial, model, connection_type, epoch, epoch))
+                first, last = ranges.get(serial, (epoch, epoch))
+                ranges[serial] = (min(first, epoch), max(last, epoch))
+            last_id = rows[-1][0]
+
+            with conn:
+                conn.executemany(insert, samples)
+                conn.executemany(UPSERT_DEVICE, devices)
+                update_rollups(conn, ranges)
+                conn.execute("UPDATE migrations SET last_id = ? WHERE name = 'device_metrics_legacy'", (last_id,))
+            migrated += len(rows)
+            logging.info(f"Migrated {migrated} legacy rows (up to id {last_id}).")
+
+        with conn:
+            conn.execute("DROP TABLE device_metrics_legacy")
+            conn.execute("UPDATE migrations SET done = 1 WHERE name = 'device_metrics_legacy'")
+        logging.info(f"Legacy device_metrics migration finished, {migrated} rows migrated.")
+    except Exception as e:
+        logging.error(f"Legacy device_metrics migration stopped, it resumes on the next start: {e}")
+    finally:
         conn.close()
+
+def rollup_query(table, source, bucket_ms):
+    """INSERT OR REPLACE recomputing the buckets of table for one device and time range from source"""
+    metrics = DB_METRIC_COLUMNS + list(DB_OPTIONAL_COLUMNS)
+    if source == 'device_metrics':
+        samples = 'COUNT(*)'
+        last_timestamp = 'MAX(timestamp)'
+        aggregates = [
+            f'MIN({column}) AS {column}_min, MAX({column}) AS {column}_max, AVG({column}) AS {column}_mean, '
+            f'COUNT({column}) AS {column}_count'
+            for column in metrics
+        ]
+        last_values = [f'r.{column}' for column in metrics]
+    else:
+        samples = 'SUM(samples)'
+        last_timestamp = 'MAX(last_timestamp)'
+        # the mean of finer buckets, weighted by their number of samples with a value; buckets
+        # written before the counts were kept fall back to all of their samples
+        aggregates = []
+        for column in metrics:
+            weight = f'CASE WHEN {column}_mean IS NOT NULL THEN COALESCE({column}_count, samples) ELSE 0 END'
+            aggregates.append(
+                f'MIN({column}_min) AS {column}_min, MAX({column}_max) AS {column}_max, '
+                f'SUM({column}_mean * {weight}) / NULLIF(SUM({weight}), 0) AS {column}_mean, '
+                f'SUM({weight}) AS {column}_count'
+            )
+        last_values = [f'r.{column}_last' for column in metrics]
+
+    selected = []
+    for column, last_value in zip(metrics, last_values):
+        selected += [f'g.{column}_min', f'g.{column}_max', f'g.{column}_mean', last_value, f'g.{column}_count']
+    return f'''
+    INSERT OR REPLACE INTO {table} (device_serial, timestamp, samples, last_timestamp, {', '.join(ROLLUP_COLUMNS)})
+    SELECT g.device_serial, g.bucket, g.samples, g.last_timestamp, {', '.join(selected)}
+    FROM (
+        SELECT device_serial, timestamp / {bucket_ms} * {bucket_ms} AS bucket, {samples} AS samples,
+            {last_timestamp} AS last_timestamp, MAX(timestamp) AS latest, {', '.join(aggregates)}
+        FROM {source}
+        WHERE device_serial = ? AND timestamp >= ? AND timestamp < ?
+        GROUP BY bucket
+    ) g
+    JOIN {source} r ON r.device_serial = g.device_serial AND r.timestamp = g.latest
+    '''
+
+def update_rollups(conn, ranges):
+    """Recompute the rollup buckets overlapping ranges, a dict of device serial to (first, last) timestamp.
+
+    Buckets are rebuilt from the finer table, so repeating it for the same
+    samples, or for samples that were ignored as duplicates, changes nothing.
+    """
+    source = 'device_metrics'
+    for table, bucket_ms in ROLLUPS:
+        query = rollup_query(table, source, bucket_ms)
+        conn.executemany(query, [
+            (serial, first // bucket_ms * bucket_ms, (last // bucket_ms + 1) * bucket_ms)
+            for serial, (first, last) in ranges.items()
+        ])
+        source = table
+
+def prune_database(conn, retention=None, vacuum_pages=1000, now=None):
+    """Delete rows older than their table's retention and return up to vacuum_pages free pages to the OS"""
+    migrating = conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'device_metrics_legacy' "
+        "UNION ALL SELECT 1 FROM migrations WHERE done = 0"
+    ).fetchone()
+    if migrating:
+        # the migration rebuilds rollup buckets from raw rows, pruning some of them meanwhile would skew those
+        logging.info("Not pruning while legacy rows are being migrated.")
+        return 0
+
+    retention = RETENTION_DAYS if retention is None else retention
+    now = epoch_ms(datetime.now()) if now is None else now
+    serials = [row[0] for row in conn.execute("SELECT device_serial FROM devices")]
+    deleted = 0
+    with conn:
+        for table, days in retention.items():
+            if days is None:
+                continue
+            cutoff = now - days * 24 * 60 * 60 * 1000
+            # per device, so the deletes are primary key range scans
+            for serial in serials:
+                deleted += conn.execute(
+                    f"DELETE FROM {table} WHERE device_serial = ? AND timestamp < ?", (serial, cutoff)
+                ).rowcount
+    # through executescript, execute() would only step it once and free a single page
+    conn.executescript(f"PRAGMA incremental_vacuum({vacuum_pages});")
+    if deleted:
+        logging.info(f"Pruned {deleted} rows past their retention.")
+    return deleted
+
+def choose_resolution(start, end, min_points=500, retention=None, now=None):
+    """The coarsest table still giving min_points buckets between start and end (epoch ms).
+
+    Tables whose retention doesn't reach back to start are skipped, unless
+    none does, then it's the coarsest one.
+    """
+    retention = RETENTION_DAYS if retention is None else retention
+    now = epoch_ms(datetime.now()) if now is None else now
+    levels = [('device_metrics', None)] + ROLLUPS
+    retained = [
+        (table, bucket_ms) for table, bucket_ms in levels
+        if retention.get(table) is None or start >= now - retention[table] * 24 * 60 * 60 * 1000
+    ] or levels[-1:]
+    for table, bucket_ms in reversed(retained):
+        if bucket_ms is None or (end - start) / bucket_ms >= min_points:
+            return table
+    return retained[0][0]
+
+def epoch_ms(timestamp):
+    """Milliseconds since the epoch of a (naive, local time) datetime"""
+    return int(timestamp.timestamp() * 1000)
+
+DB_METRIC_COLUMNS = [
+    'tasks_total', 'tasks_running', 'tasks_sleeping', 'tasks_stopped', 'tasks_zombie',
+    'mem_total', 'mem_used', 'mem_free', 'mem_buffers',
+    'swap_total', 'swap_used', 'swap_free', 'swap_cached',
+    'cpu_cpu', 'cpu_user', 'cpu_nice', 'cpu_sys', 'cpu_idle', 'cpu_iow', 'cpu_irq', 'cpu_sirq', 'cpu_host'
+]
+# columns which are NULL when a sample doesn't have them
+DB_OPTIONAL_COLUMNS = {
+    'sample_interval': 'REAL',
+    'overhead_cpu_pct': 'REAL',
+    'overhead_wall_ms': 'REAL',
+}
+
+DB_SAMPLE_COLUMNS = ['device_serial', 'timestamp'] + DB_METRIC_COLUMNS + list(DB_OPTIONAL_COLUMNS)
+
+# rollup tables and their bucket size in milliseconds, finest first, each built from the one before
+ROLLUPS = [
+    ('device_metrics_1m', 60 * 1000),
+    ('device_metrics_1h', 60 * 60 * 1000),
+]
+# count is the number of samples with a value, the weight of the mean in the coarser buckets
+ROLLUP_AGGREGATES = ['min', 'max', 'mean', 'last', 'count']
+ROLLUP_COLUMNS = [
+    f'{column}_{aggregate}'
+    for column in DB_METRIC_COLUMNS + list(DB_OPTIONAL_COLUMNS)
+    for aggregate in ROLLUP_AGGREGATES
+]
+# days each table is kept for, None keeps it forever (0 in the environment)
+RETENTION_DAYS = {
+    'device_metrics': int(os.environ.get('DROIC_RAW_RETENTION_DAYS', 7)) or None,
+    'device_metrics_1m': int(os.environ.get('DROIC_MINUTE_RETENTION_DAYS', 90)) or None,
+    'device_metrics_1h': None,
+}
+
+# the latest metadata of a device, first and last seen are epoch milliseconds; older rows (the legacy
+# migration runs alongside the writer) don't overwrite the model and connection type
+UPSERT_DEVICE = '''
+INSERT INTO devices (device_serial, model, connection_type, first_seen, last_seen) VALUES (?, ?, ?, ?, ?)
+ON CONFLICT (device_serial) DO UPDATE SET
+    model = CASE WHEN excluded.last_seen >= last_seen THEN excluded.model ELSE model END,
+    connection_type = CASE WHEN excluded.last_seen >= last_seen THEN excluded.connection_type ELSE connection_type END,
+    first_seen = min(first_seen, excluded.first_seen),
+    last_seen = max(last_seen, excluded.last_seen)
+'''
+
+def db_fields(data_point, missing=0):
+    """Map a data point to the device_metrics columns plus its device's model and connection type.
+
+    Metrics it lacks are set to missing, the timestamp is in epoch milliseconds.
+    """
+    fields = {
+        'device_serial': data_point.get('device_serial', 'unknown'),
+        'timestamp': epoch_ms(data_point['timestamp']),
+        'model': data_point.get('model', 'Unknown'),
+        'connection_type': data_point.get('connection_type', 'Unknown'),
+    }
+    for column in DB_METRIC_COLUMNS:
+        fields[column] = data_point.get(column, missing)
+    for column in DB_OPTIONAL_COLUMNS:
+        fields[column] = data_point.get(column)
+    return fields
+
+
+class DatabaseWriter:
+    """Writes data points to SQLite on a thread of its own.
+
+    The thread owns one long-lived connection in WAL mode with
+    synchronous=NORMAL (no fsync per commit) and drains a bounded queue,
+    committing with executemany once batch_size rows are waiting or
+    flush_interval seconds have passed. Rows submitted together are always
+    committed in the same transaction, along with the rollup buckets they
+    fall in. Every prune_interval seconds it prunes rows past their
+    retention. When the queue is full, submit waits up to block_timeout
+    seconds (counted as backpressure) and then drops the rows.
+    """
+    def __init__(self, db_path=None, max_queue=10000, batch_size=200, flush_interval=1.0, block_timeout=0.05,
+                 retention=None, prune_interval=3600):
+        self.db_path = db_path
+        self.retention = retention
+        self.prune_interval = prune_interval
+        self.next_prune = 0
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.block_timeout = block_timeout
+        self.queue = queue.Queue(maxsize=max_queue)
+        self.thread = None
+        self.lock = threading.Lock()
+        # the counters are updated from submitting threads and the writer thread; stop joins the
+        # writer while holding self.lock, so they have a lock of their own
+        self.stats_lock = threading.Lock()
+        # a sample at the same millisecond as a stored one is a duplicate
+        self.query = (
+            f"INSERT OR IGNORE INTO device_metrics ({', '.join(DB_SAMPLE_COLUMNS)}) "
+            f"VALUES ({', '.join(['?'] * len(DB_SAMPLE_COLUMNS))})"
+        )
+        self.reset_stats()
+
+    def reset_stats(self):
+        with self.stats_lock:
+            self.submitted = 0
+            self.written = 0
+            # duplicates skipped by INSERT OR IGNORE
+            self.ignored = 0
+            self.dropped = 0
+            self.failed = 0
+            self.backpressure = 0
+            self.batches = 0
+            self.max_queue_depth = 0
+            self.last_commit_time = None
+            self.pruned = 0
+
+    def start(self):
+        """Start the writer thread, if it is not running yet."""
+        with self.lock:
+            if self.thread is not None and self.thread.is_alive():
+                return
+            self.thread = threading.Thread(target=self._run, name="db-writer")
+            self.thread.daemon = True
+            self.thread.start()
+
+    def stop(self, timeout=5):
+        """Write everything still queued and close the connection"""
+        with self.lock:
+            if self.thread is None or not self.thread.is_alive():
+                return
+            self.queue.put(None)
+            self.thread.join(timeout)
+            if self.thread.is_alive():
+                logging.warning(f"Database writer did not finish within {timeout}s, {self.queue.qsize()} batches left.")
+            self.thread = None
+
+    def submit(self, rows):
+        """Queue rows (db_fields dicts) to be written in one transaction, False if dropped"""
+        self.start()
+        try:
+            self.queue.put_nowait(rows)
+        except queue.Full:
+            with self.stats_lock:
+                self.backpressure += 1
+            try:
+                self.queue.put(rows, timeout=self.block_timeout)
+            except queue.Full:
+                with self.stats_lock:
+                    self.dropped += len(rows)
+                    dropped = self.dropped
+                logging.warning(f"Database queue full, dropped {len(rows)} rows ({dropped} so far).")
+                return False
+        with self.stats_lock:
+            self.submitted += len(rows)
+            self.max_queue_depth = max(self.max_queue_depth, self.queue.qsize())
         return True
 
-    except Exception as e:
-        print(f"[ERROR] Failed to save data to database: {e}")
-        return False
+    def flush(self, timeout=5):
+        """Wait until everything submitted so far has been written, False on timeout"""
+        deadline = time.monotonic() + timeout
+        while self.queue.unfinished_tasks:
+            if time.monotonic() > deadline or self.thread is None:
+                return False
+            time.sleep(0.01)
+        return True
+
+    def _run(self):
+        conn = sqlite3.connect(self.db_path or DATABASE_PATH, timeout=30)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        try:
+            stopping = False
+            while not stopping:
+                item = self.queue.get()
+                if item is None:
+                    self.queue.task_done()
+                    break
+                batches = [item]
+                rows = len(item)
+                # gather more until the batch is full or the flush interval is over
+                deadline = time.monotonic() + self.flush_interval
+                while rows < self.batch_size:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    try:
+                        item = self.queue.get(timeout=remaining)
+                    except queue.Empty:
+                        break
+                    if item is None:
+                        stopping = True
+                        self.queue.task_done()
+                        break
+                    batches.append(item)
+                    rows += len(item)
+                self._write(conn, batches)
+                if time.monotonic() >= self.next_prune:
+                    self.next_prune = time.monotonic() + self.prune_interval
+                    try:
+                        pruned = prune_database(conn, self.retention)
+                        with self.stats_lock:
+                            self.pruned += pruned
+                    except Exception as e:
+                        logging.error(f"Failed to prune database: {e}")
+        finally:
+            conn.close()
+
+    def _write(self, conn, batches):
+        rows = [row for batch in batches for row in batch]
+        devices = {}
+        ranges = {}
+        for row in rows:
+            device = devices.get(row['device_serial'])
+            first_seen = device[3] if device else row['timestamp']
+            devices[row['device_serial']] = (
+                row['device_serial'], row['model'], row['connection_type'], first_seen, row['timestamp']
+            )
+            first, last = ranges.get(row['device_serial'], (row['timestamp'], row['timestamp']))
+            ranges[row['device_serial']] = (min(first, row['timestamp']), max(last, row['timestamp']))
+        try:
+            with conn:
+                cursor = conn.executemany(
+                    self.query, [tuple(row[column] for column in DB_SAMPLE_COLUMNS) for row in rows]
+                )
+                inserted = cursor.rowcount
+                conn.executemany(UPSERT_DEVICE, devices.values())
+                update_rollups(conn, ranges)
+            with self.stats_lock:
+                self.written += inserted
+                self.ignored += len(rows) - inserted
+                self.batches += 1
+                self.last_commit_time = time.time()
+        except Exception as e:
+            with self.stats_lock:
+                self.failed += len(rows)
+            logging.error(f"Failed to save {len(rows)} rows to database: {e}")
+        for _ in batches:
+            self.queue.task_done()
+
+    def get_stats(self):
+        """Counters of the writer, including queued and dropped rows"""
+        with self.stats_lock:
+            return {
+                "submitted": self.submitted,
+                "written": self.written,
+                "ignored": self.ignored,
+                "queued": self.submitted - self.written - self.ignored - self.failed,
+                "dropped": self.dropped,
+                "failed": self.failed,
+                "backpressure": self.backpressure,
+                "batches": self.batches,
+                "max_queue_depth": self.max_queue_depth,
+                "last_commit_time": self.last_commit_time,
+                "pruned": self.pruned,
+            }
+
+
+database_writer = DatabaseWriter()
+# write what is still queued when droic exits
+atexit.register(database_writer.stop)
+
+def save_data_to_db(data_point):
+    """Queue a single data point for the SQLite database"""
+    return save_data_points_to_db([data_point])
+
+def save_data_points_to_db(data_points, missing=0):
+    """Queue several data points for the SQLite database, they are written in a single transaction"""
+    rows = [db_fields(data_point, missing) for data_point in data_points]
+    if not rows:
+        return True
+    return database_writer.submit(rows)
 
 
 if os.environ.get("WERKZEUG_RUN_MAIN") == "true":
@@ -0,0 +1,152 @@
+import asyncio
+import logging
+import threading
+import time
+
+from utils.adb import adb_client, fork_latencies, native_latencies
+
+
+class AsyncAdbExecutor:
+    """Runs adb commands concurrently on one asyncio event loop in a background thread.
+
+    Every device gets a semaphore limiting how many commands run on it at once, so
+    one slow Wi-Fi device only blocks its own queue. Each call has a deadline
+    (time.monotonic() based) which covers waiting for the semaphore as well as the
+    command itself; commands still running at the deadline are killed.
+
+    Coroutines (run, run_all) are for code already on the loop, submit, run_sync
+    and run_all_sync are the synchronous facade for threads.
+    """
+    def __init__(self, max_per_device=2, timeout=10):
+        self.max_per_device = max_per_device
+        self.timeout = timeout
+        self.loop = None
+        self.thread = None
+        self.semaphores = {}
+        self.lock = threading.Lock()
+
+    def start(self):
+        """Start the event loop thread, if it is not running yet."""
+        with self.lock:
+            if self.loop is not None:
+                return
+            self.loop = asyncio.new_event_loop()
+            self.thread = threading.Thread(target=self.loop.run_forever, name="adb-executor")
+            self.thread.daemon = True
+            self.thread.start()
+
+    def stop(self):
+        with self.lock:
+            if self.loop is None:
+                return
+            self.loop.call_soon_threadsafe(self.loop.stop)
+            self.thread.join(timeout=1.0)
+            self.loop = None
+            self.semaphores = {}
+
+    def _semaphore(self, device_id):
+        semaphore = self.semaphores.get(device_id)
+        if semaphore is None:
+            semaphore = asyncio.Semaphore(self.max_per_device)
+            self.semaphores[device_id] = semaphore
+        return semaphore
+
+    async def run(self, cmd, device_id=None, timeout=None, deadline=None):
+        """Run an adb command and return its output, None on timeout or failure."""
+        if deadline is None:
+            deadline = time.monotonic() + (timeout or self.timeout)
+        try:
+            # the default event loop clock is time.monotonic()
+            async with asyncio.timeout_at(deadline):
+                async with self._semaphore(device_id):
+                    return await self._execute(cmd, device_id)
+        except TimeoutError:
+            logging.error(f"Command {cmd} on {device_id} missed its deadline.")
+            return None
+
+    async def run_all(self, calls, timeout=None):
+        """Run (cmd, device_id) pairs concurrently under one shared deadline."""
+        deadline = time.monotonic() + (timeout or self.timeout)
+        return await asyncio.gather(
+            *(self.run(cmd, device_id, deadline=deadline) for cmd, device_id in calls)
+        )
+
+    async def _execute(self, cmd, device_id):
+        start = time.perf_counter()
+        output = await self._execute_native(cmd, device_id)
+        if output is not None:
+            native_latencies.append(time.perf_counter() - start)
+            return output
+
+        base_cmd = ['adb']
+        if device_id:
+            base_cmd += ['-s', device_id]
+        process = await asyncio.create_subprocess_exec(
+            *base_cmd, *cmd,
+            stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.DEVNULL
+        )
+        try:
+            stdout, _ = await process.communicate()
+        except asyncio.CancelledError:
+            # cancelled or past the deadline, don't leave the adb client behind
+            process.kill()
+            await process.wait()
+            raise
+        fork_latencies.append(time.perf_counter() - start)
+        return stdout.decode(errors='replace').strip()
+
+    async def _execute_native(self, cmd, device_id):
+        """Run shell and get-state commands over the adb server protocol, None if not possible."""
+        if not device_id or not cmd:
+            return None
+        if cmd[0] == 'shell' and len(cmd) > 1:
+            requests = [f'host:transport:{device_id}', f"shell:{' '.join(cmd[1:])}"]
+        elif cmd == ['get-state']:
+            requests = [f'host-serial:{device_id}:get-state']
+        else:
+            return None
+
+        try:
+            reader, writer = await asyncio.open_connection(adb_client.host, adb_client.port)
+        except OSError:
+            return None
+
+        try:
+            for request in requests:
+                payload = request.encode()
+                writer.write(b'%04x' % len(payload) + payload)
+                await writer.drain()
+                status = await reader.readexactly(4)
+                if status != b'OKAY':
+                    # FAIL, the adb binary would print nothing on stdout either
+                    return ''
+            if cmd == ['get-state']:
+                size = int(await reader.readexactly(4), 16)
+                output = await reader.readexactly(size)
+            else:
+                output = await reader.read()
+            return output.decode(errors='replace').strip()
+        except (OSError, asyncio.IncompleteReadError):
+            return ''
+        finally:
+            writer.close()
+
+    def submit(self, cmd, device_id=None, timeout=None):
+        """Schedule a command from any thread, returns a concurrent.futures.Future.
+
+        Cancelling the future cancels the command and kills its process.
+        """
+        self.start()
+        return asyncio.run_coroutine_threadsafe(self.run(cmd, device_id, timeout=timeout), self.loop)
+
+    def run_sync(self, cmd, device_id=None, timeout=None):
+        """Blocking version of run, for callers outside the event loop."""
+        return self.submit(cmd, device_id, timeout).result()
+
+    def run_all_sync(self, calls, timeout=None):
+        """Blocking version of run_all, returns the outputs in the order of calls."""
+        self.start()
+        return asyncio.run_coroutine_threadsafe(self.run_all(calls, timeout), self.loop).result()
+
+
+adb_executor = AsyncAdbExecutor()
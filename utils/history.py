@@ -0,0 +1,188 @@
+import logging
+import sqlite3
+from datetime import datetime
+
+import numpy as np
+
+from utils.data import DATABASE_PATH, DB_METRIC_COLUMNS, DB_OPTIONAL_COLUMNS, ROLLUPS, choose_resolution, epoch_ms
+
+HISTORY_METRICS = DB_METRIC_COLUMNS + list(DB_OPTIONAL_COLUMNS)
+ROLLUP_TABLES = [table for table, _ in ROLLUPS]
+
+
+def connect(db_path=None):
+    """Read-only connection to the database, readers don't block the writer in WAL mode"""
+    return sqlite3.connect(f"file:{db_path or DATABASE_PATH}?mode=ro", uri=True, timeout=30)
+
+def to_epoch_ms(value):
+    """Epoch milliseconds of a datetime, anything else is taken as epoch milliseconds already"""
+    if isinstance(value, datetime):
+        return epoch_ms(value)
+    return int(value)
+
+def to_datetimes(timestamps):
+    """Epoch milliseconds back to naive local datetime64 values, the way they were recorded"""
+    return np.array(
+        [datetime.fromtimestamp(timestamp / 1000) for timestamp in timestamps.tolist()],
+        dtype='datetime64[ms]'
+    )
+
+def list_devices(db_path=None):
+    """Devices with stored samples, most recently seen first"""
+    try:
+        conn = connect(db_path)
+        try:
+            rows = conn.execute(
+                "SELECT device_serial, model, connection_type, first_seen, last_seen FROM devices ORDER BY last_seen DESC"
+            ).fetchall()
+        finally:
+            conn.close()
+    except Exception as e:
+        logging.error(f"Failed to list devices: {e}")
+        return []
+
+    return [
+        {
+            'device_serial': serial,
+            'model': model,
+            'connection_type': connection_type,
+            'first_seen': datetime.fromtimestamp(first_seen / 1000),
+            'last_seen': datetime.fromtimestamp(last_seen / 1000),
+        }
+        for serial, model, connection_type, first_seen, last_seen in rows
+    ]
+
+def lttb(x, y, threshold):
+    """Indices of the points Largest-Triangle-Three-Buckets keeps of x, y (sorted by x).
+
+    The first and last point are always kept, the others are split into
+    threshold - 2 buckets of equal size and of every bucket the point forming
+    the largest triangle with the neighbouring buckets is kept. Classic LTTB
+    takes the point kept in the previous bucket as the triangle's first corner,
+    which makes it sequential; here it's the previous bucket's average, like
+    the third corner is the next bucket's, so all buckets are done in one
+    vectorised pass.
+    """
+    n = len(x)
+    if threshold >= n or threshold < 3:
+        return np.arange(n)
+
+    # relative to the first point, epoch milliseconds times values would lose precision
+    x = x.astype(np.float64) - x[0]
+    y = y.astype(np.float64)
+
+    edges = np.linspace(1, n - 1, threshold - 1).astype(np.int64)
+    starts, ends = edges[:-1], edges[1:]
+    counts = ends - starts
+    x_sums = np.concatenate(([0.0], np.cumsum(x)))
+    y_sums = np.concatenate(([0.0], np.cumsum(y)))
+    x_means = (x_sums[ends] - x_sums[starts]) / counts
+    y_means = (y_sums[ends] - y_sums[starts]) / counts
+
+    # corners a (previous bucket) and c (next bucket) of every bucket
+    a_x = np.concatenate(([x[0]], x_means[:-1]))
+    a_y = np.concatenate(([y[0]], y_means[:-1]))
+    c_x = np.concatenate((x_means[1:], [x[-1]]))
+    c_y = np.concatenate((y_means[1:], [y[-1]]))
+
+    bucket = np.repeat(np.arange(len(counts)), counts)
+    middle_x = x[1:n - 1]
+    middle_y = y[1:n - 1]
+    # twice the triangle area, enough to compare
+    areas = np.abs(
+        (a_x[bucket] - c_x[bucket]) * (middle_y - a_y[bucket])
+        - (a_x[bucket] - middle_x) * (c_y[bucket] - a_y[bucket])
+    )
+
+    largest = np.maximum.reduceat(areas, starts - 1)
+    candidates = np.flatnonzero(areas == largest[bucket])
+    # the first point reaching the largest area of its bucket
+    _, first = np.unique(bucket[candidates], return_index=True)
+    return np.concatenate(([0], candidates[first] + 1, [n - 1]))
+
+def fetch_range(conn, table, device_serial, columns, start, end, chunk_size=10000):
+    """Timestamps and columns of a device between start and end (epoch ms), as numpy arrays.
+
+    Rows are read from the primary key range in chunks of chunk_size straight
+    into arrays, NULLs become NaN.
+    """
+    cursor = conn.execute(
+        f"SELECT timestamp, {', '.join(columns)} FROM {table} "
+        f"WHERE device_serial = ? AND timestamp >= ? AND timestamp <= ? ORDER BY timestamp",
+        (device_serial, start, end)
+    )
+    timestamp_chunks = []
+    value_chunks = []
+    while True:
+        rows = cursor.fetchmany(chunk_size)
+        if not rows:
+            break
+        chunk = np.array(rows, dtype=np.float64)
+        timestamp_chunks.append(chunk[:, 0].astype(np.int64))
+        value_chunks.append(chunk[:, 1:])
+
+    if not timestamp_chunks:
+        return np.empty(0, dtype=np.int64), np.empty((0, len(columns)))
+    return np.concatenate(timestamp_chunks), np.concatenate(value_chunks)
+
+def query_history(device_serial, metrics, start, end, points=2000, aggregate='mean', resolution=None, db_path=None):
+    """Stored values of metrics for a device between start and end, downsampled to about points each.
+
+    start and end are datetimes or epoch milliseconds, clamped to when the
+    device was first and last seen. The table read is the coarsest one still
+    giving points buckets over the range (see choose_resolution), unless
+    resolution names one. Rollups are read from the bucket start falls in,
+    as their aggregate (min, max, mean or last); max keeps spikes shorter
+    than a bucket.
+    Every metric is downsampled with lttb on its own. Returns a dict with the
+    resolution, the number of rows read and per metric a (timestamps,
+    values) pair of arrays, timestamps as local datetime64; None on failure.
+    """
+    start = to_epoch_ms(start)
+    end = to_epoch_ms(end)
+    unknown = [metric for metric in metrics if metric not in HISTORY_METRICS]
+    if unknown:
+        logging.error(f"Unknown history metrics: {unknown}")
+        return None
+    if aggregate not in ('min', 'max', 'mean', 'last'):
+        logging.error(f"Unknown history aggregate: {aggregate}")
+        return None
+
+    if resolution and resolution != 'device_metrics' and resolution not in ROLLUP_TABLES:
+        logging.error(f"Unknown history resolution: {resolution}")
+        return None
+
+    try:
+        conn = connect(db_path)
+        try:
+            seen = conn.execute(
+                "SELECT first_seen, last_seen FROM devices WHERE device_serial = ?", (device_serial,)
+            ).fetchone()
+            if seen:
+                # a range mostly without samples would get a too coarse table
+                start, end = max(start, seen[0]), min(end, seen[1])
+            table = resolution or choose_resolution(start, end, min_points=points)
+            if table == 'device_metrics':
+                columns = list(metrics)
+            else:
+                columns = [f'{metric}_{aggregate}' for metric in metrics]
+                bucket_ms = dict(ROLLUPS)[table]
+                start = start // bucket_ms * bucket_ms
+            timestamps, values = fetch_range(conn, table, device_serial, columns, start, end)
+        finally:
+            conn.close()
+    except Exception as e:
+        logging.error(f"Failed to query history of {device_serial}: {e}")
+        return None
+
+    series = {}
+    for index, metric in enumerate(metrics):
+        column = values[:, index]
+        present = ~np.isnan(column)
+        metric_timestamps = timestamps[present]
+        column = column[present]
+        keep = lttb(metric_timestamps, column, points)
+        series[metric] = (to_datetimes(metric_timestamps[keep]), column[keep])
+
+    logging.info(f"History of {device_serial}: {len(timestamps)} rows from {table}, {len(metrics)} metrics.")
+    return {'resolution': table, 'rows': len(timestamps), 'series': series}
@@ -1,8 +1,10 @@
 import logging
 import time
+from collections import deque
 
 # droic
-from utils.adb import run_adb_command, get_unique_devices, get_device_model, get_device_serial, get_device_ip, connect_wifi_adb
+from utils.executor import adb_executor
+from utils.adb import run_shell_command, get_shell_session, get_unique_devices, get_device_model, get_device_serial, get_device_ip, connect_wifi_adb
 
 class NotificationManager:
     def __init__(self):
@@ -40,6 +42,89 @@ class NotificationManager:
         return self.current_message, self.current_class, self.clear_disabled
 
 
+class TransportSelector:
+    """Chooses between the transports (USB, Wi-Fi) of a device by measured round trips.
+
+    Every transport keeps a rolling window of round-trip latencies, failed
+    round trips count as errors. A transport's score is its mean latency
+    divided by its success rate, i.e. the expected time per successful round
+    trip. A switch needs both transports measured at least min_samples times,
+    a score better by the hysteresis factor, and min_dwell seconds since the
+    last switch, so the choice doesn't flap. Transports are measured every
+    probe_interval seconds with the same `echo` round trip.
+    """
+    def __init__(self, window=20, min_samples=3, hysteresis=0.3, min_dwell=30, probe_interval=30):
+        self.window = window
+        self.min_samples = min_samples
+        self.hysteresis = hysteresis
+        self.min_dwell = min_dwell
+        self.probe_interval = probe_interval
+        self.samples = {}
+        self.last_switch = 0
+        self.next_check = 0
+
+    def record(self, device_id, latency):
+        """Record a round trip on a transport, latency None for a failure"""
+        if device_id not in self.samples:
+            self.samples[device_id] = deque(maxlen=self.window)
+        self.samples[device_id].append(latency)
+
+    def forget(self, device_id):
+        self.samples.pop(device_id, None)
+
+    def get_stats(self, device_id):
+        samples = list(self.samples.get(device_id, ()))
+        latencies = [latency for latency in samples if latency is not None]
+        error_rate = 1 - len(latencies) / len(samples) if samples else 0
+        mean_latency = sum(latencies) / len(latencies) if latencies else None
+        if mean_latency is None:
+            score = float('inf') if samples else None
+        else:
+            score = mean_latency / (1 - error_rate)
+        return {
+            "samples": len(samples),
+            "mean_latency_ms": round(1000 * mean_latency, 2) if mean_latency is not None else None,
+            "error_rate": round(error_rate, 2),
+            "score": score,
+        }
+
+    def is_measured(self, device_id):
+        return len(self.samples.get(device_id, ())) >= self.min_samples
+
+    def probe(self, device_id, count=1):
+        """Time `count` round trips over the transport's shell session"""
+        for _ in range(count):
+            start = time.perf_counter()
+            output = get_shell_session(device_id).run('echo ok', timeout=2)
+            if output != 'ok':
+                self.record(device_id, None)
+                # don't hold up monitoring with more round trips to a dead transport
+                return
+            self.record(device_id, time.perf_counter() - start)
+
+    def best(self, device_ids):
+        """The transport with the best score, None unless all of them are measured"""
+        if not device_ids or not all(self.is_measured(device_id) for device_id in device_ids):
+            return None
+        return min(device_ids, key=lambda device_id: self.get_stats(device_id)["score"])
+
+    def should_switch(self, current, device_ids, now=None):
+        """Return the transport to switch to, None to stay on the current one"""
+        now = time.monotonic() if now is None else now
+        best = self.best(device_ids)
+        if current not in device_ids:
+            # the current transport is gone and its samples forgotten, nothing to compare with
+            return best
+        if now - self.last_switch < self.min_dwell:
+            return None
+        if best is None or best == current:
+            return None
+        current_score = self.get_stats(current)["score"]
+        if self.get_stats(best)["score"] < current_score * (1 - self.hysteresis):
+            return best
+        return None
+
+
 class ConnectionManager:
     """Class to manage device connections via ADB (Android Debug Bridge)"""
     def __init__(self):
@@ -53,14 +138,25 @@ class ConnectionManager:
         }
         self.wifi_connect_ip = None
         self.wifi_connect_serial = None
+        self.transport_selector = TransportSelector()
         logging.debug("ConnectionManager initialized")
 
     def get_best_connection_for_serial(self, serial_number):
-        """Return the best connection ID for a given serial number, preferring USB over WiFi"""
+        """Return the best connection ID for a given serial number.
+
+        The transport with the best measured round trips, if they all have been
+        measured, otherwise USB is preferred over Wi-Fi.
+        """
         devices = get_unique_devices()
         logging.info(f"Finding best connection for serial : {serial_number}")
         if serial_number in devices:
             device_ids = devices[serial_number]
+            best_device_id = self.transport_selector.best(device_ids)
+            if best_device_id:
+                conn_type = "Wi-Fi" if ':' in best_device_id else "USB"
+                logging.info(f"Found fastest connection for serial {serial_number}: {best_device_id}")
+                return best_device_id, conn_type
+
             # more priority for USB connections
             for device_id in device_ids:
                 if ':' not in device_id:
@@ -122,26 +218,52 @@ class ConnectionManager:
         logging.critical("Failed to find a usable device connection.")
         return False
     
-    def check_for_better_connection(self):
-        """Check if there's a better connection available for the current device"""
-        if not self.device_info['persistent_id']:
+    def check_for_better_connection(self, probe_all=False):
+        """Measure the device's transports when due and switch to a clearly faster one.
+
+        Transports are only looked up and probed every probe_interval seconds,
+        so this is cheap to call on every tick. probe_all does it right away
+        and measures new transports fully, for when the device registry
+        reported a change. Returns True if the connection changed.
+        """
+        serial_number = self.device_info['persistent_id']
+        current = self.device_info['device_id']
+        selector = self.transport_selector
+        now = time.monotonic()
+        if not serial_number or not current or (not probe_all and now < selector.next_check):
             return False
-            
-        # keep checking for USB
-        if self.device_info['connection_type'] == "USB":
+        selector.next_check = now + selector.probe_interval
+
+        device_ids = get_unique_devices().get(serial_number, [])
+        for device_id in list(selector.samples):
+            if device_id not in device_ids:
+                selector.forget(device_id)
+        if len(device_ids) < 2:
             return False
-            
-        best_device_id, conn_type = self.get_best_connection_for_serial(self.device_info['persistent_id'])
-        
-        if best_device_id and conn_type == "USB" and self.device_info['connection_type'] == "Wi-Fi":
-            logging.info(f"Switching from Wi-Fi to USB connection: {best_device_id}")
-            self.device_info['device_id'] = best_device_id
-            self.device_info['connection_type'] = "USB"
-            logging.info("Switched to USB connection.")
-            return True
-            
-        return False
-    
+
+        # the same shell round trip on every transport, so the latencies compare
+        for device_id in device_ids:
+            count = 1 if selector.is_measured(device_id) else selector.min_samples
+            selector.probe(device_id, count)
+
+        best_device_id = selector.should_switch(current, device_ids, now)
+        if not best_device_id:
+            return False
+
+        current_stats = selector.get_stats(current)
+        best_stats = selector.get_stats(best_device_id)
+        conn_type = "Wi-Fi" if ':' in best_device_id else "USB"
+        logging.info(
+            f"Switching from {self.device_info['connection_type']} {current} "
+            f"({current_stats['mean_latency_ms']} ms, {current_stats['error_rate']} errors) "
+            f"to {conn_type} {best_device_id} "
+            f"({best_stats['mean_latency_ms']} ms, {best_stats['error_rate']} errors)"
+        )
+        selector.last_switch = now
+        self.device_info['device_id'] = best_device_id
+        self.device_info['connection_type'] = conn_type
+        return True
+
     def try_wifi_connect(self, serial_number):
         """Connect to a device via Wi-Fi using its serial number"""
                 
@@ -155,13 +277,18 @@ class ConnectionManager:
             device_ids = devices[serial_number]
             usb_device_id = None
             logging.info(f"Available device IDs for {serial_number}: {device_ids}")
+            # query all transports concurrently, a stale Wi-Fi transport can't hold up the USB one
+            device_states = dict(zip(
+                device_ids,
+                adb_executor.run_all_sync([(['get-state'], device_id) for device_id in device_ids], timeout=5)
+            ))
             # check if already connected via Wi-Fi
             for device_id in device_ids:
                 if ':' in device_id:
                     # test if the Wi-Fi connection is actually responsive
                     logging.info(f"Found existing Wi-Fi connection in device ids : {device_id}")
                     logging.info(f"Checking state of {device_id} using get-state in adb...")
-                    device_state = run_adb_command(['get-state'], device_id)
+                    device_state = device_states[device_id]
                     logging.info(f"Found Wi-Fi connection, checking Wi-Fi connection state for {device_id}: {device_state}")
                     if device_state and 'device' in device_state.lower():
                         logging.info(f"Device state : {device_state}")
@@ -173,7 +300,7 @@ class ConnectionManager:
             # USB connection
             for device_id in device_ids:
                 if ':' not in device_id:
-                    device_state = run_adb_command(['get-state'], device_id)
+                    device_state = device_states[device_id]
                     logging.info(f"Existing Wi-Fi connection not found, checking USB connection state for {device_id}: {device_state}")
                     if device_state and 'device' in device_state.lower():
                         logging.info(f"Found active USB connection for {serial_number}: {device_id}")
@@ -210,9 +337,10 @@ class ConnectionManager:
         """Check if a device connection is still valid"""
         if not device_id:
             return False
-            
-        device_state = run_adb_command(['get-state'], device_id)
-        return device_state and 'device' in device_state.lower()
+
+        # a round trip over the persistent shell session is cheaper than forking `adb get-state`
+        device_state = run_shell_command(['echo', 'device'], device_id)
+        return device_state is not None and 'device' in device_state.lower()
     
     def find_device_connection(self, serial_number):
         """Try to find any valid connection for a device with the given serial number"""
@@ -1,9 +1,34 @@
 import logging
+import numpy as np
 import pandas as pd
+import random
 import threading
 import time
-from utils.data import save_data_to_db, remove_ansi_escape_codes, parse_top_summary
-from utils.adb import run_adb_command
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from utils.data import save_data_to_db, save_data_points_to_db, remove_ansi_escape_codes, parse_top_summary, iter_top_frames, parse_proc_snapshot, compute_proc_metrics, parse_burst_output, compute_burst_metrics, parse_thermal_zones, parse_dumpsys_battery, parse_dumpsys_meminfo, parse_overhead, compute_overhead
+from utils.manager import ConnectionManager
+from utils.adb import get_shell_session, close_shell_session, interrupt_device_commands, get_latency_stats, device_registry, AdbStream, run_exec_out, run_batch
+
+# samples /proc on the device into a file, which is sent back in one go when the loop ends
+BURST_COMMAND = (
+    "n=0; while [ $n -lt {count} ]; do cat /proc/uptime /proc/stat; sleep {period}; n=$((n+1)); done > {path}; "
+    "cat {path}; rm -f {path}"
+)
+BURST_PATH = "/data/local/tmp/droic_burst"
+
+# read around droic's own commands to measure what collecting costs the device
+OVERHEAD_START = "cat /proc/uptime"
+OVERHEAD_END = "cat /proc/uptime /proc/$$/stat"
+
+COLLECTION_MODES = ["top", "stream", "proc", "exec-out"]
+
+# collection modes whose sample command is sent in one batch with the liveness check and probes
+BATCHED_COMMANDS = {
+    "top": "top -n 1",
+    "proc": "cat /proc/stat /proc/meminfo /proc/loadavg",
+}
 
 
 class MonitoringController:
@@ -11,77 +36,463 @@ class MonitoringController:
         self.connection_manager = connection_manager
         self.state = monitoring_state
         self.notification_manager = None
+        # wakes up the monitoring loop: the monitored device connected or disconnected,
+        # or monitoring was stopped, paused, resumed or got a new interval
+        self.wake_event = threading.Event()
+        self.scheduler = None
+        # bumped on every stop, a monitoring thread exits once its generation is outdated
+        self.generation = 0
+        self.transports_changed = True
+        device_registry.add_listener(self._on_device_event)
+        # extra shell commands (name -> command) sent along with each batched sample
+        self.extra_probes = {}
+        # slower probes with their own period, run between samples
+        self.collectors = CollectorScheduler()
+        for collector in default_collectors():
+            self.add_collector(collector)
+        # continuous top process and its frame generator, used by the "stream" collection mode
+        self.top_stream = None
+        self.top_frames = None
+        # previous /proc counters, used by the "proc" collection mode for CPU deltas
+        self.last_proc_snapshot = None
+        # previous reading of the collecting shell's CPU time, for the overhead of the next sample
+        self.last_overhead = None
+        # pid of the streaming top and the device uptime it started at
+        self.top_stream_info = None
+        # delay the streaming top was started with and when its last frame arrived
+        self.top_stream_period = None
+        self.last_frame_time = None
+        # set from other threads, the collecting thread restarts the top stream before its next frame
+        self.stream_restart = False
+        # collection mode waiting to be applied by the collecting thread, see set_collection_mode
+        self.requested_collection_mode = None
+        self.mode_lock = threading.Lock()
+
+    def _on_device_event(self, event, serial_number, device_id):
+        """Device registry listener, reacts to the monitored device coming and going"""
+        if serial_number == self.connection_manager.device_info["persistent_id"]:
+            logging.info(f"Monitored device {serial_number} {event} via {device_id}")
+            self.transports_changed = True
+            if event == "connected":
+                # probe right away instead of waiting for the backoff to expire
+                self.state.reconnection.device_appeared()
+            self.wake_event.set()
 
     def start_monitoring(
-        self, interval=5, selected_device_id=None, monitoring_interval=2
+        self, interval=5, selected_device_id=None, monitoring_interval=2, collection_mode="top",
+        sampling_mode="fixed"
     ):
         if self.state.monitoring_active:
             logging.warning("Monitoring already active.")
             return False
 
-        self.state.auto_stopped = False
-        self.state.monitoring_interval = monitoring_interval
+        previous_thread = self.state.monitoring_thread
+        if previous_thread and previous_thread.is_alive():
+            # a stopped thread exits as soon as it wakes, never run two collectors
+            previous_thread.join(timeout=1.0)
 
-        if not self.connection_manager.setup_device_connection(selected_device_id):
-            logging.error("Failed to set up device connection.")
+        if not self.prepare_monitoring(selected_device_id, monitoring_interval, collection_mode, sampling_mode):
             return False
 
-        self.state.monitoring_active = True
-        self.state.monitoring_thread = threading.Thread(target=self._monitor_device)
+        self.state.monitoring_thread = threading.Thread(target=self._monitor_device, args=(self.generation,))
         self.state.monitoring_thread.daemon = True
         self.state.monitoring_thread.start()
 
         logging.info(
-            f"Started monitoring with {self.state.monitoring_interval}s interval."
+            f"Started {self.state.sampling_mode} monitoring with {self.state.monitoring_interval}s interval."
         )
         return True
 
+    def prepare_monitoring(
+        self, selected_device_id=None, monitoring_interval=2, collection_mode="top", sampling_mode="fixed"
+    ):
+        """Set up the device connection and mark monitoring active, without starting a thread"""
+        self.state.auto_stopped = False
+        self.state.monitoring_interval = monitoring_interval
+        self.state.collection_mode = collection_mode
+        self.state.sampling_mode = sampling_mode
+        self.state.adaptive.reset(monitoring_interval)
+        self.state.bytes_transferred = 0
+        self.state.reset_tick_stats()
+        self.state.reconnection.reset()
+        self.last_proc_snapshot = None
+        self.last_overhead = None
+        self.stream_restart = False
+        self.requested_collection_mode = None
+
+        if not self.connection_manager.setup_device_connection(selected_device_id):
+            logging.error("Failed to set up device connection.")
+            return False
+
+        self.state.monitoring_active = True
+        return True
+
     def stop_monitoring(self):
         if not self.state.monitoring_active:
             logging.warning("Monitoring not active.")
             return
 
         self.state.reset_monitoring_state()
+        self.generation += 1
+        self.interrupt_collection()
 
         if self.state.monitoring_thread:
             self.state.monitoring_thread.join(timeout=1.0)
+            if self.state.monitoring_thread.is_alive():
+                logging.warning("Monitoring thread did not exit in time.")
 
         logging.info("Monitoring stopped.")
 
-    def _monitor_device(self):
-        """Main monitoring loop with state-based handling"""
-        while self.state.monitoring_active:
+    def interrupt_collection(self):
+        """Wake the monitoring loop and abort the adb command in flight instead of waiting for it"""
+        self.wake_event.set()
+        if self.connection_manager.device_info["device_id"]:
+            interrupt_device_commands(self.connection_manager.device_info["device_id"])
+        self._close_top_stream()
+
+    def pause_monitoring(self):
+        """Suspend sampling without stopping monitoring"""
+        self.state.user_paused = True
+        self.interrupt_collection()
+        logging.info("Monitoring paused by user.")
+
+    def resume_monitoring(self):
+        self.state.user_paused = False
+        if self.scheduler:
+            self.scheduler.reschedule(now=time.monotonic() - self.state.effective_interval)
+        self.wake_event.set()
+        logging.info("Monitoring resumed by user.")
+
+    def set_monitoring_interval(self, monitoring_interval):
+        """Change the sampling interval, applies to the next tick"""
+        self.state.monitoring_interval = monitoring_interval
+        self.state.adaptive.reset(monitoring_interval)
+        if self.scheduler:
+            self.scheduler.reschedule()
+        if self.state.collection_mode == "stream":
+            # the streaming top keeps the delay it was started with, restart it
+            self.stream_restart = True
+            self._close_top_stream()
+        self.wake_event.set()
+        logging.info(f"Monitoring interval set to {monitoring_interval}s.")
+
+    def set_sampling_mode(self, sampling_mode):
+        """Switch between a fixed interval and adaptive sampling ("fixed" or "adaptive")"""
+        self.state.sampling_mode = sampling_mode
+        self.state.adaptive.reset(self.state.monitoring_interval)
+        if self.scheduler:
+            self.scheduler.reschedule()
+        self.wake_event.set()
+        logging.info(f"Sampling mode set to {sampling_mode}.")
+
+    def capture_burst(self, duration=5, rate=20):
+        """Capture `rate` CPU samples per second for `duration` seconds, buffered on the device.
+
+        The device runs the sampling loop on its own and sends all samples back
+        in one transfer, so the rate is not limited by the adb round trip.
+        Regular sampling is suspended meanwhile. The samples are added to the
+        live data and saved in a single transaction. Returns the number of
+        samples, None if the capture failed.
+        """
+        if not self.state.monitoring_active or self.state.monitoring_paused or self.state.burst_active:
+            logging.warning("Burst capture needs active, connected monitoring.")
+            return None
+        if self.state.comparison_active:
+            # a burst would end up in the comparison's samples
+            logging.warning("Burst capture is not possible while collection methods are compared.")
+            return None
+
+        rate = min(50, max(1, rate))
+        count = int(duration * rate) + 1
+        device_id = self.connection_manager.device_info["device_id"]
+        command = BURST_COMMAND.format(count=count, period=round(1 / rate, 3), path=BURST_PATH)
+
+        self.state.burst_active = True
+        try:
+            logging.info(f"Capturing a {duration}s burst at {rate} Hz on {device_id}")
+            start_time = datetime.now()
+            output = run_exec_out(command, device_id, timeout=duration * 2 + 10)
+            if not output or not self.state.burst_active:
+                logging.error(f"Burst capture on {device_id} failed.")
+                return None
+
+            frames = parse_burst_output(output.decode(errors="replace"))
+            points = compute_burst_metrics(
+                frames, start_time, device_serial=self.connection_manager.device_info["persistent_id"]
+            )
+            for data in points:
+                data["model"] = self.connection_manager.device_info["model"]
+                data["connection_type"] = self.connection_manager.device_info["connection_type"]
+
+            if self.state.save_to_local_db:
+                # burst samples have no memory values, store them as NULL rather than 0
+                save_data_points_to_db(points, missing=None)
+            self.state.bytes_transferred += len(output)
+            self.state.add_data_points(points)
+            logging.info(f"Burst capture on {device_id} got {len(points)} samples in {len(output)} bytes")
+            if self.notification_manager:
+                self.notification_manager.set_notification(
+                    f"Captured {len(points)} burst samples.", "notification-success", 3
+                )
+            return len(points)
+        finally:
+            # an interrupted or timed out loop leaves its file behind
             try:
-                if self.state.monitoring_paused:
-                    self._handle_paused_state()
-                else:
-                    self._handle_active_monitoring()
+                run_exec_out(f"rm -f {BURST_PATH}", device_id)
             except Exception as e:
-                logging.error(f"Monitoring error: {e}")
+                logging.debug(f"Failed to remove {BURST_PATH} on {device_id}: {e}")
+            self.state.burst_active = False
+            if self.scheduler:
+                self.scheduler.reschedule(now=time.monotonic() - self.state.effective_interval)
+            self.wake_event.set()
 
-            time.sleep(self.state.monitoring_interval)
+    def set_collection_mode(self, collection_mode):
+        """Switch the collection method, the collecting thread applies it on the next tick"""
+        with self.mode_lock:
+            self.requested_collection_mode = collection_mode
+        self.wake_event.set()
+        logging.info(f"Collection mode set to {collection_mode}.")
 
-    def _handle_paused_state(self):
-        """Handle monitoring when in paused state (reconnection)"""
-        logging.info(
-            f"Entering Paused state with a timeout of {self.state.max_pause_duration}"
+    def _apply_collection_mode(self):
+        """Switch to the collection method requested last, only called from the collecting thread"""
+        with self.mode_lock:
+            collection_mode, self.requested_collection_mode = self.requested_collection_mode, None
+        if collection_mode is None:
+            return
+        self.state.collection_mode = collection_mode
+        # closed on the thread reading it, never in the middle of a read
+        self._close_top_stream()
+        self.last_proc_snapshot = None
+        self.last_overhead = None
+
+    def compare_collection_methods(self, window=10, modes=COLLECTION_MODES):
+        """Run each collection method for `window` seconds and report what it costs the device.
+
+        Needs active monitoring, which goes back to its original method
+        afterwards. Returns the results sorted from cheapest to most expensive
+        device CPU, None if monitoring stopped meanwhile. The results are also
+        kept in state.overhead_comparison.
+        """
+        if not self.state.monitoring_active or self.state.monitoring_paused:
+            logging.warning("Comparing collection methods needs active, connected monitoring.")
+            return None
+        if self.state.comparison_active or self.state.burst_active:
+            logging.warning("A comparison or burst capture is already running.")
+            return None
+
+        self.state.comparison_active = True
+        original_mode = self.state.collection_mode
+        results = []
+        try:
+            for mode in modes:
+                self.set_collection_mode(mode)
+                # the window starts once the monitoring thread switched
+                while self.requested_collection_mode is not None:
+                    if not self.state.monitoring_active:
+                        return None
+                    time.sleep(0.05)
+                started = datetime.now()
+                deadline = time.monotonic() + window
+                while time.monotonic() < deadline:
+                    if not self.state.monitoring_active:
+                        return None
+                    time.sleep(min(0.1, max(0, deadline - time.monotonic())))
+                results.append(self._summarize_overhead(mode, started, window))
+        finally:
+            self.state.comparison_active = False
+            if self.state.monitoring_active:
+                self.set_collection_mode(original_mode)
+
+        # methods whose CPU could not be measured go last
+        results.sort(key=lambda result: (result["cpu_pct"] is None, result["cpu_pct"] or 0))
+        self.state.overhead_comparison = results
+        cheapest = results[0]
+        logging.info(f"Collection method comparison: {results}")
+        if self.notification_manager:
+            if cheapest["cpu_pct"] is None:
+                self.notification_manager.set_notification(
+                    "No collection method's CPU use could be measured.", "notification-error", 4, duration=10
+                )
+            else:
+                self.notification_manager.set_notification(
+                    f"Cheapest collection method: {cheapest['mode']} ({cheapest['cpu_pct']}% CPU).",
+                    "notification-success", 4, duration=10
+                )
+        return results
+
+    def _summarize_overhead(self, mode, started, window):
+        """Device cost of the samples collected since `started` with one collection method"""
+        snapshot = self.state.buffer.snapshot
+        mask = snapshot.timestamps >= np.datetime64(started, "us")
+
+        def column_mean(name):
+            if not snapshot.has_column(name):
+                return None
+            values = snapshot.column(name)[mask]
+            values = values[~np.isnan(values)]
+            return round(float(values.mean()), 2) if len(values) else None
+
+        if mode == "stream":
+            # the streaming top isn't measured per sample, read its own counters once
+            cpu_pct = self._stream_overhead()
+        elif snapshot.has_column("overhead_cpu_ms") and mask.any():
+            cpu_ms = np.nansum(snapshot.column("overhead_cpu_ms")[mask])
+            cpu_pct = round(float(cpu_ms) / (10 * window), 2)
+        else:
+            cpu_pct = None
+
+        return {
+            "mode": mode,
+            "samples": int(mask.sum()),
+            "cpu_pct": cpu_pct,
+            "wall_ms": column_mean("overhead_wall_ms") if mode != "stream" else None,
+            "bytes_per_sample": column_mean("bytes_transferred"),
+        }
+
+    def _stream_overhead(self):
+        """CPU used by the streaming top since it started, in percent of one core"""
+        if not self.top_stream_info:
+            return None
+        pid, uptime_start = self.top_stream_info
+        output = get_shell_session(self.connection_manager.device_info["device_id"]).run(
+            f"{OVERHEAD_START}; {OVERHEAD_START} /proc/{pid}/stat"
         )
-        logging.info(
-            f"Time left until waiting timeout : {self.state.pause_start_time + self.state.max_pause_duration - time.time()}"
+        if not output:
+            return None
+        lines = output.splitlines()
+        reading = parse_overhead(lines[0], "\n".join(lines[1:]))
+        if reading is None or reading["uptime_end"] <= uptime_start:
+            return None
+        return round(reading["jiffies"] / (reading["uptime_end"] - uptime_start), 2)
+
+    def add_collector(self, collector):
+        """Register a Collector, it runs between samples at its own period"""
+        self.collectors.register(collector)
+
+    def remove_collector(self, name):
+        self.collectors.unregister(name)
+
+    def _run_collectors(self):
+        """Run the next due collector if it fits before the next sample and within the cost budget"""
+        if not self.collectors.collectors or self.scheduler is None:
+            return
+        if self.state.comparison_active:
+            # their shell's CPU time would be charged to the batched methods being compared
+            return
+        now = time.monotonic()
+        next_sample = self._next_sample_time()
+        collector = self.collectors.plan(now, next_sample - now)
+        if collector is None:
+            return
+
+        device_id = self.connection_manager.device_info["device_id"]
+        start = time.monotonic()
+        # on a session of their own, an overrunning dumpsys only restarts that one
+        output = get_shell_session(device_id, "collectors").run(
+            collector.command, timeout=max(0.1, next_sample - start)
         )
-        if self.notification_manager:
-            self.notification_manager.set_notification(
-                "Monitoring paused.", "notification-error", 4
-            )
-        # Check for timeout
-        if (
-            self.state.pause_start_time
-            and (time.time() - self.state.pause_start_time)
-            > self.state.max_pause_duration
-        ):
+        duration = time.monotonic() - start
+        result = None
+        if output is not None:
+            try:
+                result = collector.parse(output) if collector.parse else output
+            except Exception as e:
+                logging.error(f"Collector {collector.name} failed to parse its output: {e}")
+        self.collectors.record(collector, start, duration, result)
+        if result is not None:
+            self.state.collector_results[collector.name] = result
+        logging.debug(f"Collector {collector.name} took {round(duration, 3)}s")
+
+    def _next_sample_time(self):
+        """When the next sample is due, in stream mode a stream period after the last frame"""
+        if self.paced_by_device():
+            # the scheduler doesn't fire while the device paces the samples
+            if self.last_frame_time is None:
+                return time.monotonic()
+            return self.last_frame_time + self.top_stream_period
+        return self.scheduler.deadline
+
+    def _is_current(self, generation):
+        return self.state.monitoring_active and generation == self.generation
+
+    def _monitor_device(self, generation):
+        """Main monitoring loop with state-based handling"""
+        self.scheduler = scheduler = TickScheduler(self.state)
+        while self._is_current(generation):
+            # sleep until the next tick (or reconnection probe), or until something needs the loop's attention
+            reconnection = self.state.reconnection
+            if self.state.user_paused:
+                timeout = None
+            elif self.state.monitoring_paused:
+                timeout = reconnection.time_until_probe()
+            else:
+                timeout = scheduler.time_until_deadline()
+            if self.wake_event.wait(timeout):
+                # only re-check the state, samples stay on the tick grid
+                self.wake_event.clear()
+                continue
+
+            if self.state.monitoring_paused:
+                if not (reconnection.is_due() or reconnection.timed_out()):
+                    continue
+            elif not scheduler.is_due():
+                continue
+            else:
+                scheduler.fire()
+
+            self.run_tick(generation)
+
+            if self.paced_by_device():
+                while self.paced_by_device() and self._is_current(generation):
+                    self.run_tick(generation)
+                # the scheduler stood still while the device set the pace, count ticks from now on
+                scheduler.reschedule(now=time.monotonic())
+
+        if self.generation == generation:
+            # after a restart the stream belongs to the new generation
+            self._close_top_stream()
+
+    def run_tick(self, generation=None):
+        """Run a single monitoring step, collecting a sample or trying to reconnect.
+
+        Samples of a tick whose generation was outdated meanwhile are dropped.
+        """
+        if generation is None:
+            generation = self.generation
+        self._apply_collection_mode()
+        if self.state.user_paused or self.state.burst_active:
+            return
+        try:
+            if self.state.monitoring_paused:
+                self._handle_paused_state()
+            else:
+                self._handle_active_monitoring(generation)
+                if not self.state.monitoring_paused:
+                    # expensive probes never share a round trip with the sample
+                    self._run_collectors()
+        except Exception as e:
+            logging.error(f"Monitoring error: {e}")
+
+    def paced_by_device(self):
+        """True if the next tick should run right away, in stream mode the device emits frames at its own pace"""
+        return (
+            self.state.collection_mode == "stream"
+            and self.requested_collection_mode is None
+            and self.top_frames is not None
+            and not self.state.monitoring_paused
+            and not self.state.user_paused
+            and not self.state.burst_active
+        )
+
+    def _handle_paused_state(self):
+        """Handle monitoring when in paused state (reconnection)"""
+        reconnection = self.state.reconnection
+        if reconnection.timed_out():
             logging.warning(
-                f"Device reconnection timed out after {self.state.max_pause_duration} seconds. Stopping monitoring."
+                f"Device reconnection timed out after {self.state.max_pause_duration} seconds "
+                f"and {reconnection.probes} probes. Stopping monitoring."
             )
+            reconnection.gave_up()
             if self.notification_manager:
                 self.notification_manager.set_notification(
                     "Monitoring stopped due to wait timeout.", "notification-error", 5
@@ -91,7 +502,18 @@ class MonitoringController:
             self.state.monitoring_paused = False
             return
 
+        if not reconnection.is_due():
+            # backing off, ticks in between don't touch the adb server
+            return
+
+        if self.notification_manager:
+            self.notification_manager.set_notification(
+                "Monitoring paused.", "notification-error", 4
+            )
+
         # Try to reconnect
+        reconnection.begin_probe()
+        self.state.reconnect_attempts = reconnection.probes
         current_serial = self.connection_manager.device_info["persistent_id"]
         best_device_id, conn_type = self.connection_manager.find_device_connection(
             current_serial
@@ -102,11 +524,16 @@ class MonitoringController:
             self.connection_manager.device_info["connection_type"] = conn_type
 
             if self.connection_manager.check_device_connection(best_device_id):
+                outage = reconnection.reconnected()
+                if self.scheduler:
+                    # sample right away instead of counting the outage as skipped ticks
+                    self.scheduler.reschedule(now=time.monotonic() - self.state.effective_interval)
                 self.state.monitoring_paused = False
                 self.state.pause_start_time = None
                 self.state.reconnection_success = True
                 logging.info(
-                    f"Successfully reconnected to device {current_serial} via {conn_type}"
+                    f"Successfully reconnected to device {current_serial} via {conn_type} "
+                    f"after {outage['duration']}s and {outage['probes']} probes"
                 )
                 if self.notification_manager:
                     self.notification_manager.set_notification(
@@ -116,33 +543,41 @@ class MonitoringController:
                     )
                 return
 
-        self.state.reconnect_attempts += 1
-
-        # if self.state.reconnect_attempts >= self.state.max_reconnect_attempts:
-        #     logging.error(f"Failed to reconnect after {self.state.max_reconnect_attempts} attempts. Stopping monitoring.")
-        #     self.state.auto_stopped = True
-        #     self.state.monitoring_active = False
-        #     self.state.monitoring_paused = False
+        reconnection.probe_failed()
+        logging.info(
+            f"Device {current_serial} not back yet, next probe in {round(reconnection.time_until_probe(), 1)}s"
+        )
 
-    def _handle_active_monitoring(self):
+    def _handle_active_monitoring(self, generation):
         """Handle normal active monitoring state"""
         current_device_id = self.connection_manager.device_info["device_id"]
 
-        if self.connection_manager.device_info["connection_type"] == "Wi-Fi":
-            self.connection_manager.check_for_better_connection()
+        # a transport which just appeared gets measured right away, the others when their probe is due
+        probe_all, self.transports_changed = self.transports_changed, False
+        if self.connection_manager.check_for_better_connection(probe_all):
+            current_device_id = self.connection_manager.device_info["device_id"]
 
+        if self.state.collection_mode in BATCHED_COMMANDS:
+            # a failed batch doubles as the liveness check
+            if not self._collect_batched_data(generation):
+                self._handle_connection_lost(generation)
+            return
 
         if not self.connection_manager.check_device_connection(current_device_id):
-            self._handle_connection_lost()
+            self._handle_connection_lost(generation)
             return
 
-        self._collect_device_data()
+        self._collect_device_data(generation)
 
-    def _handle_connection_lost(self):
+    def _handle_connection_lost(self, generation):
         """Handle case when device connection is lost"""
+        if not self._is_current(generation) or self.state.user_paused:
+            # the command failed because it was interrupted, not because the device went away
+            return
         current_serial = self.connection_manager.device_info["persistent_id"]
         logging.warning(f"Device connection lost for {current_serial}")
-
+        close_shell_session(self.connection_manager.device_info["device_id"])
+        self._close_top_stream()
 
         best_device_id, conn_type = self.connection_manager.find_device_connection(
             current_serial
@@ -162,75 +597,220 @@ class MonitoringController:
             self.state.monitoring_paused = True
             self.state.pause_start_time = time.time()
             self.state.reconnect_attempts = 1
+            # the lookup above was the first probe of this outage
+            self.state.reconnection.connection_lost()
             logging.warning(f"Device {current_serial} disconnected. Monitoring paused.")
 
-    def _collect_device_data(self):
-        """Collect and process device data"""
+    def _collect_device_data(self, generation):
+        """Collect and process device data using the selected (non-batched) collection mode"""
+        if self.state.collection_mode == "stream":
+            self._collect_streamed_data(generation)
+        elif self.state.collection_mode == "exec-out":
+            self._collect_exec_out_data(generation)
+
+    def _collect_batched_data(self, generation):
+        """Run the sample command and any extra probes in a single round trip.
+
+        Returns False if the batch could not be run, i.e. the device is not reachable.
+        """
+        device_id = self.connection_manager.device_info["device_id"]
+        commands = {"overhead_start": OVERHEAD_START, "sample": BATCHED_COMMANDS[self.state.collection_mode]}
+        commands.update(self.extra_probes)
+        commands["overhead_end"] = OVERHEAD_END
+
+        results = run_batch(commands, device_id)
+        if results is None:
+            return False
+
+        overhead = self._measure_overhead(results.pop("overhead_start", ""), results.pop("overhead_end", ""))
+        self.state.probe_results = {
+            name: output for name, output in results.items() if name != "sample"
+        }
+        raw_output = results.get("sample")
+        if not raw_output:
+            logging.warning("No output received.")
+            return True
+
+        session = get_shell_session(device_id)
+        latency = f"{session.last_latency:.3f}" if session.last_latency is not None else "n/a"
+        logging.debug(
+            f"Batch of {len(commands)} commands took {latency}s, fork path averages {get_latency_stats()['fork']}ms"
+        )
+        try:
+            if self.state.collection_mode == "proc":
+                self._process_proc_output(raw_output, generation, overhead)
+            else:
+                self._process_top_output(raw_output, session.last_latency, generation, overhead)
+        except Exception as e:
+            logging.error(f"Error processing data: {e}")
+        return True
+
+    def _measure_overhead(self, start_output, end_output, cumulative=True):
+        """Device-side CPU and wall time of the commands collecting this sample, {} if unknown"""
+        reading = parse_overhead(start_output, end_output)
+        if reading is None:
+            return {}
+        overhead = compute_overhead(self.last_overhead, reading, cumulative)
+        self.last_overhead = reading
+        return overhead
 
-        max_retries = 3
-        retry_delay = 1
+    def _process_top_output(self, raw_output, transfer_time, generation, overhead=None):
+        """Parse the output of `top -n 1` and store the sample"""
+        clean_output = remove_ansi_escape_codes(raw_output)
+        lines = clean_output.splitlines()
 
-        for attempt in range(max_retries):
+        data = parse_top_summary(
+            lines,
+            device_serial=self.connection_manager.device_info["persistent_id"],
+        )
+        if data:
+            data["bytes_transferred"] = len(raw_output.encode())
+            data["transfer_time"] = transfer_time
+            data.update(overhead or {})
+            self._store_data_point(data, generation)
+
+    def _collect_streamed_data(self, generation):
+        """Collect the next frame of a continuous `top -d` running on the device"""
+        device_id = self.connection_manager.device_info["device_id"]
+        if self.stream_restart or (self.top_stream and self.top_stream.device_id != device_id):
+            self.stream_restart = False
+            self._close_top_stream()
+
+        if self.top_frames is None:
+            if not self._is_current(generation):
+                # stopped meanwhile, a restarted monitoring opens its own stream
+                return
+            interval = self.state.monitoring_interval
+            logging.info(f"Starting top stream on {device_id} with {interval}s delay")
+            # top replaces the shell, so $$ is top's pid, for measuring its overhead later
+            self.top_stream = AdbStream(
+                ["shell", f"{OVERHEAD_START};", "echo", "$$;", "exec", "top", "-b", "-d", str(interval)], device_id
+            )
+            lines = self.top_stream.lines(timeout=interval * 2 + 10)
             try:
-                raw_output = run_adb_command(
-                    ["shell", "top", "-n", "1"],
-                    self.connection_manager.device_info["device_id"],
-                )
+                uptime_start = float(next(lines).split()[0])
+                self.top_stream_info = (int(next(lines)), uptime_start)
+            except (StopIteration, ValueError, IndexError):
+                self.top_stream_info = None
+            self.top_frames = iter_top_frames(lines)
+            self.top_stream_period = interval
+            self.last_frame_time = None
 
-                if not raw_output:
-                    if attempt < max_retries - 1:
-                        logging.warning(
-                            f"No output received. Retry {attempt + 1}/{max_retries}..."
-                        )
-                        time.sleep(retry_delay)
-                        continue
-                    else:
-                        logging.error("Failed to get data after max retries")
-                        return
+        # the stream may be closed from another thread meanwhile
+        frames = self.top_frames
+        frame = next(frames, None) if frames is not None else None
+        if frame is None:
+            if self.state.collection_mode != "stream" or self.stream_restart:
+                # closed because the collection mode or the interval changed
+                return
+            # restarted on the next tick, after the connection check
+            logging.warning(f"top stream on {device_id} ended, restarting.")
+            self.state.stream_restarts += 1
+            self._close_top_stream()
+            return
+        self.last_frame_time = time.monotonic()
 
-                clean_output = remove_ansi_escape_codes(raw_output)
-                lines = clean_output.splitlines()
+        data = parse_top_summary(
+            frame, device_serial=self.connection_manager.device_info["persistent_id"]
+        )
+        if data:
+            self._store_data_point(data, generation)
 
-                data = parse_top_summary(
-                    lines,
-                    device_serial=self.connection_manager.device_info["persistent_id"],
-                )
-                if data:
-                    device_id = self.connection_manager.device_info["device_id"]
-                    conn_type = "Wi-Fi" if ":" in device_id else "USB"
-                    if (
-                        conn_type
-                        != self.connection_manager.device_info["connection_type"]
-                    ):
-                        self.connection_manager.device_info["connection_type"] = (
-                            conn_type
-                        )
+    def _process_proc_output(self, raw_output, generation, overhead=None):
+        """Parse /proc/stat, /proc/meminfo and /proc/loadavg and store the CPU delta sample"""
+        snapshot = parse_proc_snapshot(raw_output)
+        if snapshot is None:
+            return
+
+        previous, self.last_proc_snapshot = self.last_proc_snapshot, snapshot
+        if previous is None:
+            # the first snapshot only primes the CPU counters
+            return
+
+        data = compute_proc_metrics(
+            previous, snapshot, device_serial=self.connection_manager.device_info["persistent_id"]
+        )
+        if data:
+            data.update(overhead or {})
+            self._store_data_point(data, generation)
 
-                    data["model"] = self.connection_manager.device_info["model"]
-                    data["connection_type"] = self.connection_manager.device_info[
-                        "connection_type"
-                    ]
+    def _collect_exec_out_data(self, generation):
+        """Collect one sample over exec-out, with the device trimming top to its summary"""
+        device_id = self.connection_manager.device_info["device_id"]
 
-                    if self.state.save_to_local_db:
-                        save_data_to_db(data)
+        start = time.perf_counter()
+        # no pty, so no escape codes to strip, and only the header leaves the device
+        raw_output = run_exec_out(f"{OVERHEAD_START}; top -b -n 1 | head -n 5; {OVERHEAD_END}", device_id)
+        transfer_time = time.perf_counter() - start
+        if not raw_output:
+            logging.warning("No output received from exec-out.")
+            return
 
+        lines = raw_output.decode(errors="replace").splitlines()
+        # skip anything printed before the summary
+        start_index = next((i for i, line in enumerate(lines) if line.strip().startswith("Tasks:")), 0)
+        data = parse_top_summary(
+            [line.strip() for line in lines[start_index:]],
+            device_serial=self.connection_manager.device_info["persistent_id"],
+        )
+        if data:
+            data["bytes_transferred"] = len(raw_output)
+            data["transfer_time"] = transfer_time
+            # every exec-out command runs in a shell of its own
+            data.update(self._measure_overhead(lines[0], "\n".join(lines[-2:]), cumulative=False))
+            self._store_data_point(data, generation)
 
-                    self._handle_device_change()
+    def _close_top_stream(self):
+        if self.top_stream:
+            self.top_stream.close()
+        self.top_stream = None
+        self.top_frames = None
+        self.top_stream_info = None
+        self.top_stream_period = None
+        self.last_frame_time = None
 
-                    self.state.add_data_point(data)
+    def _store_data_point(self, data, generation):
+        """Add device metadata to a parsed sample, save it and add it to the live data"""
+        if not self._is_current(generation) or self.state.user_paused:
+            # a late sample from a collection which was stopped, restarted or paused meanwhile
+            return
 
-                break
+        device_id = self.connection_manager.device_info["device_id"]
+        conn_type = "Wi-Fi" if ":" in device_id else "USB"
+        if conn_type != self.connection_manager.device_info["connection_type"]:
+            self.connection_manager.device_info["connection_type"] = conn_type
 
-            except Exception as e:
-                if attempt < max_retries - 1:
-                    logging.warning(
-                        f"Error collecting data: {e}. Retry {attempt + 1}/{max_retries}..."
-                    )
-                    time.sleep(retry_delay)
-                else:
-                    logging.error(
-                        f"Failed to collect data after {max_retries} attempts: {e}"
-                    )
+        data["model"] = self.connection_manager.device_info["model"]
+        data["connection_type"] = self.connection_manager.device_info["connection_type"]
+        # the interval this sample was taken at, before adapting it to the sample
+        data["sample_interval"] = self.state.effective_interval
+        self._adapt_interval(data)
+
+        if self.state.save_to_local_db:
+            save_data_to_db(data)
+
+        if "bytes_transferred" in data:
+            self.state.bytes_transferred += data["bytes_transferred"]
+            logging.debug(
+                f"Sample transferred {data['bytes_transferred']} bytes in {data['transfer_time']}s"
+            )
+
+        self._handle_device_change()
+
+        self.state.add_data_point(data)
+
+    def _adapt_interval(self, data):
+        """In adaptive mode, retune the sampling interval to the latest sample"""
+        if self.state.sampling_mode != "adaptive" or self.state.collection_mode == "stream":
+            # a top stream is paced by the device, its delay is fixed when it starts
+            return
+        previous = self.state.adaptive.interval
+        interval = self.state.adaptive.update(data)
+        if interval != previous:
+            logging.debug(f"Adaptive sampling interval {previous}s -> {interval}s")
+            if interval < previous and self.scheduler:
+                # speed up from the next tick rather than after the longer wait
+                self.scheduler.reschedule()
 
     def _handle_device_change(self):
         """Handle case when monitored device has changed"""
@@ -248,29 +828,560 @@ class MonitoringController:
             logging.info(
                 f"Device changed from {self.connection_manager.device_info['last_device_serial']} to {self.connection_manager.device_info['persistent_id']}, clearing plot data"
             )
-            self.state.collected_data.drop(
-                self.state.collected_data.index, inplace=True
-            )
+            self.state.buffer.clear()
             self.connection_manager.device_info["last_device_serial"] = (
                 self.connection_manager.device_info["persistent_id"]
             )
 
 
+class TickScheduler:
+    """Fixed-rate tick deadlines on the monotonic clock.
+
+    Deadlines are absolute (start + k * interval), so time spent collecting does
+    not shift the following ticks. When a tick fires late enough to miss whole
+    periods, the missed ticks are coalesced into it and counted as skipped.
+    The interval is read from the state on every tick; reschedule applies a
+    change to the deadline already waited for.
+    """
+    def __init__(self, state, start=None):
+        self.state = state
+        self.deadline = time.monotonic() if start is None else start
+        self.last_fire = None
+
+    def time_until_deadline(self):
+        return max(0, self.deadline - time.monotonic())
+
+    def is_due(self, now=None):
+        return (time.monotonic() if now is None else now) >= self.deadline
+
+    def fire(self, now=None):
+        """Record that the tick for the current deadline runs now and move to the next one"""
+        now = time.monotonic() if now is None else now
+        interval = self.state.effective_interval
+        lateness = max(0, now - self.deadline)
+        skipped = int(lateness // interval)
+        self.deadline += (skipped + 1) * interval
+        self.last_fire = now
+        self.state.record_tick(lateness, skipped)
+        if skipped:
+            logging.debug(f"Collection overran, skipped {skipped} tick(s).")
+
+    def reschedule(self, now=None):
+        """Restart the grid one interval after the last tick (or now), for an interval change"""
+        if now is None:
+            now = self.last_fire if self.last_fire is not None else time.monotonic()
+        self.deadline = now + self.state.effective_interval
+
+
+class Collector:
+    """A probe with its own period, e.g. a dumpsys, too slow to run with every sample.
+
+    cost_budget is the device time (seconds) one run is expected to take; it is
+    used as the cost estimate until the collector has been timed. parse turns
+    the command output into the result, the raw output is kept if it is None.
+    """
+    def __init__(self, name, command, period, cost_budget, parse=None):
+        self.name = name
+        self.command = command
+        self.period = period
+        self.cost_budget = cost_budget
+        self.parse = parse
+        self.next_due = 0
+        self.runs = 0
+        self.failures = 0
+        self.deferred = 0
+        self.over_budget = 0
+        self.durations = deque(maxlen=20)
+        self.last_result = None
+
+    @property
+    def cost_estimate(self):
+        """Mean measured run time, the declared cost budget before the first run"""
+        if not self.durations:
+            return self.cost_budget
+        return sum(self.durations) / len(self.durations)
+
+    def get_stats(self):
+        return {
+            "period": self.period,
+            "cost_budget": self.cost_budget,
+            "cost_estimate": round(self.cost_estimate, 3),
+            "max_duration": round(max(self.durations, default=0), 3),
+            "runs": self.runs,
+            "failures": self.failures,
+            "deferred": self.deferred,
+            "over_budget": self.over_budget,
+        }
+
+
+def thermal_collector(period=10):
+    return Collector(
+        "thermal", "cat /sys/class/thermal/thermal_zone*/temp", period, 0.05, parse_thermal_zones
+    )
+
+
+def battery_collector(period=30):
+    return Collector("battery", "dumpsys battery", period, 0.2, parse_dumpsys_battery)
+
+
+def meminfo_collector(package, period=60):
+    return Collector(f"meminfo:{package}", f"dumpsys meminfo {package}", period, 1.0, parse_dumpsys_meminfo)
+
+
+def default_collectors():
+    """Collectors every controller starts with, the meminfo one follows system_server"""
+    return [thermal_collector(), battery_collector(), meminfo_collector("system_server")]
+
+
+class CollectorScheduler:
+    """Picks which collector runs in the gap after a sample.
+
+    At most one collector runs per gap, and only if its cost estimate fits in
+    the time left before the next sample, so probes are staggered and never
+    delay the fast CPU/memory sample. All collector runs share a device time
+    budget: over any `window` seconds they may take at most `budget` of it
+    (0.05 = 5%). Due collectors which would exceed it are deferred.
+    """
+    def __init__(self, budget=0.05, window=60, margin=0.05):
+        self.budget = budget
+        self.window = window
+        self.margin = margin
+        self.collectors = {}
+        # (end time, duration) of recent runs
+        self.runs = deque()
+
+    def register(self, collector):
+        if collector.name in self.collectors:
+            logging.warning(f"Replacing collector {collector.name}.")
+        self.collectors[collector.name] = collector
+        logging.info(f"Registered collector {collector.name} every {collector.period}s.")
+
+    def unregister(self, name):
+        self.collectors.pop(name, None)
+
+    def spent(self, now=None):
+        """Device time taken by collectors in the current window"""
+        now = time.monotonic() if now is None else now
+        while self.runs and self.runs[0][0] < now - self.window:
+            self.runs.popleft()
+        return sum(duration for _, duration in self.runs)
+
+    def plan(self, now, time_left):
+        """Return the most overdue collector which fits in time_left and the budget, None if there is none"""
+        spent = self.spent(now)
+        due = sorted(
+            (collector for collector in self.collectors.values() if collector.next_due <= now),
+            key=lambda collector: collector.next_due,
+        )
+        for collector in due:
+            estimate = collector.cost_estimate
+            if estimate + self.margin > time_left:
+                # try again in a later, longer gap
+                continue
+            if spent + estimate > self.budget * self.window:
+                collector.deferred += 1
+                collector.next_due = now + min(collector.period, self.window) / 2
+                logging.debug(f"Collector {collector.name} deferred, {round(spent, 3)}s of budget used.")
+                continue
+            return collector
+        return None
+
+    def record(self, collector, start, duration, result):
+        collector.runs += 1
+        collector.durations.append(duration)
+        collector.next_due = start + collector.period
+        if result is None:
+            collector.failures += 1
+        else:
+            collector.last_result = result
+        if duration > collector.cost_budget:
+            collector.over_budget += 1
+            logging.debug(f"Collector {collector.name} took {round(duration, 3)}s, over its {collector.cost_budget}s budget.")
+        self.runs.append((start + duration, duration))
+
+    def get_stats(self):
+        """Per collector timing and the share of the budget in use"""
+        return {
+            "budget": self.budget,
+            "spent": round(self.spent(), 3),
+            "collectors": {name: collector.get_stats() for name, collector in self.collectors.items()},
+        }
+
+
+class AdaptiveSampler:
+    """Adaptive sampling interval, driven by how much CPU and memory usage move.
+
+    Each sample's CPU busy and memory used percentages are compared with the
+    previous sample. A jump larger than change_threshold percentage points, or
+    usage above cpu_threshold / mem_threshold, halves the interval (down to
+    min_interval) so spikes are sampled densely. Otherwise the interval grows
+    by backoff towards max_interval while the device is steady. There is no
+    memory threshold by default, Android keeps memory nearly full with caches.
+    """
+    def __init__(
+        self, min_interval=0.5, max_interval=30, change_threshold=10,
+        cpu_threshold=80, mem_threshold=None, backoff=1.5
+    ):
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.change_threshold = change_threshold
+        self.cpu_threshold = cpu_threshold
+        self.mem_threshold = mem_threshold
+        self.backoff = backoff
+        self.reset()
+
+    def reset(self, interval=5):
+        """Start again from the given interval"""
+        self.interval = min(self.max_interval, max(self.min_interval, interval))
+        self.previous = None
+
+    def usage(self, data):
+        """CPU busy and memory used, in percent, None where a sample lacks the fields"""
+        cpu = mem = None
+        if data.get("cpu_cpu"):
+            cpu = 100 * (data["cpu_cpu"] - data.get("cpu_idle", 0)) / data["cpu_cpu"]
+        if data.get("mem_total"):
+            mem = 100 * data.get("mem_used", 0) / data["mem_total"]
+        return cpu, mem
+
+    def update(self, data):
+        """Feed a sample, returns the interval to use for the next one"""
+        current = self.usage(data)
+        cpu, mem = current
+        active = (
+            (cpu is not None and self.cpu_threshold is not None and cpu > self.cpu_threshold)
+            or (mem is not None and self.mem_threshold is not None and mem > self.mem_threshold)
+        )
+        if self.previous is not None:
+            changes = [
+                abs(value - previous)
+                for value, previous in zip(current, self.previous)
+                if value is not None and previous is not None
+            ]
+            active = active or any(change > self.change_threshold for change in changes)
+        self.previous = current
+
+        if active:
+            self.interval = max(self.min_interval, self.interval / 2)
+        else:
+            self.interval = min(self.max_interval, self.interval * self.backoff)
+        self.interval = round(self.interval, 3)
+        return self.interval
+
+
+class ReconnectionStateMachine:
+    """Reconnection after a connection loss, probing with jittered exponential backoff.
+
+    States: "connected" -> "backoff" on connection_lost, "backoff" -> "probing"
+    when a probe starts, "probing" -> "connected" or back to "backoff" with a
+    doubled delay, and "gave_up" once the outage outlasts max_pause_duration.
+    A device appearing in the registry makes the next probe due immediately.
+    Every finished outage is recorded with its duration and number of probes.
+    """
+    def __init__(self, state, base_delay=0.5, max_delay=8.0, jitter=0.5):
+        self.state = state
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.jitter = jitter
+        self.outages = deque(maxlen=50)
+        self.reset()
+
+    def reset(self):
+        self.status = "connected"
+        self.lost_at = None
+        self.next_probe = None
+        self.failures = 0
+        self.probes = 0
+
+    def connection_lost(self, now=None):
+        """Enter backoff, the lookup which detected the loss counts as the first probe"""
+        now = time.monotonic() if now is None else now
+        self.status = "backoff"
+        self.lost_at = now
+        self.failures = 0
+        self.probes = 1
+        self.next_probe = now + self.delay()
+
+    def delay(self):
+        """Backoff delay before the next probe, randomised so probes of several devices spread out"""
+        delay = min(self.max_delay, self.base_delay * 2 ** self.failures)
+        return delay * random.uniform(1 - self.jitter, 1)
+
+    def time_until_probe(self, now=None):
+        """Seconds until the next probe or the timeout, whichever comes first"""
+        if self.next_probe is None:
+            return 0
+        now = time.monotonic() if now is None else now
+        deadline = min(self.next_probe, self.lost_at + self.state.max_pause_duration)
+        return max(0, deadline - now)
+
+    def is_due(self, now=None):
+        now = time.monotonic() if now is None else now
+        return self.status == "backoff" and now >= self.next_probe
+
+    def timed_out(self, now=None):
+        now = time.monotonic() if now is None else now
+        return self.lost_at is not None and now - self.lost_at > self.state.max_pause_duration
+
+    def device_appeared(self):
+        if self.status == "backoff":
+            self.next_probe = time.monotonic()
+
+    def begin_probe(self):
+        self.status = "probing"
+        self.probes += 1
+
+    def probe_failed(self, now=None):
+        now = time.monotonic() if now is None else now
+        self.status = "backoff"
+        self.failures += 1
+        self.next_probe = now + self.delay()
+
+    def reconnected(self, now=None):
+        """Close the outage, returns its record"""
+        return self._end_outage(True, now)
+
+    def gave_up(self, now=None):
+        outage = self._end_outage(False, now)
+        self.status = "gave_up"
+        return outage
+
+    def _end_outage(self, reconnected, now):
+        now = time.monotonic() if now is None else now
+        outage = {
+            "duration": round(now - self.lost_at, 3) if self.lost_at is not None else 0,
+            "probes": self.probes,
+            "reconnected": reconnected,
+        }
+        self.outages.append(outage)
+        self.reset()
+        return outage
+
+    def get_stats(self):
+        """Summary of past outages: time to reconnect and probes issued"""
+        reconnected = [outage for outage in self.outages if outage["reconnected"]]
+        durations = [outage["duration"] for outage in reconnected]
+        return {
+            "outages": len(self.outages),
+            "reconnected": len(reconnected),
+            "mean_time_to_reconnect": sum(durations) / len(durations) if durations else 0,
+            "max_time_to_reconnect": max(durations, default=0),
+            "probes": sum(outage["probes"] for outage in self.outages),
+            "last_outage": self.outages[-1] if self.outages else None,
+        }
+
+
+class BufferSnapshot:
+    """Immutable, versioned view of the buffered data points.
+
+    The arrays are read-only views which the writer never modifies again, so
+    a snapshot stays consistent for as long as a reader holds on to it.
+    """
+    __slots__ = ("version", "timestamps", "columns", "labels")
+
+    def __init__(self, version, timestamps, columns, labels):
+        self.version = version
+        self.timestamps = timestamps
+        self.columns = columns
+        self.labels = labels
+
+    def __len__(self):
+        return len(self.timestamps)
+
+    def column(self, name):
+        return self.columns[name]
+
+    def has_column(self, name):
+        return name in self.columns
+
+
+class MetricRingBuffer:
+    """Fixed-capacity columnar buffer of the latest data points.
+
+    Every numeric metric gets its own float array next to a timestamp array.
+    The arrays hold twice the capacity and are only ever appended to; when they
+    are full, the latest points are copied into fresh arrays (amortised O(1)
+    per append). Positions which have been published are therefore never
+    written again, and after every append the writer publishes a BufferSnapshot
+    of views over them: readers just take `buffer.snapshot`, without locks or
+    copies. Non-numeric fields (serial, model, ...) only keep their latest value
+    in labels.
+    """
+    def __init__(self, capacity=1000):
+        self.capacity = capacity
+        self.write_lock = threading.Lock()
+        self.version = 0
+        self._reset()
+        self._publish()
+
+    def _reset(self):
+        self.timestamp_array = np.empty(2 * self.capacity, dtype="datetime64[us]")
+        self.columns = {}
+        self.labels = {}
+        self.end = 0
+        self.size = 0
+
+    def __len__(self):
+        return self.size
+
+    def append(self, data):
+        with self.write_lock:
+            self._write(data)
+            self._publish()
+
+    def extend(self, points):
+        """Append several data points, publishing a single snapshot at the end"""
+        with self.write_lock:
+            for data in points:
+                self._write(data)
+            self._publish()
+
+    def _write(self, data):
+        if self.end == len(self.timestamp_array):
+            self._compact()
+
+        i = self.end
+        self.timestamp_array[i] = np.datetime64(data["timestamp"], "us")
+        for key, value in data.items():
+            if key == "timestamp":
+                continue
+            if isinstance(value, (int, float, np.number)) and not isinstance(value, bool):
+                column = self.columns.get(key)
+                if column is None:
+                    # a metric seen for the first time has no values for the older points
+                    column = np.full(len(self.timestamp_array), np.nan)
+                    self.columns[key] = column
+                column[i] = value
+            else:
+                self.labels[key] = value
+
+        for key, column in self.columns.items():
+            if key not in data:
+                column[i] = np.nan
+
+        self.end += 1
+        self.size = min(self.size + 1, self.capacity)
+
+    def _compact(self):
+        """Move the points which stay in the buffer into new arrays, leaving published ones untouched"""
+        keep = self.capacity - 1
+        start = self.end - keep
+        timestamp_array = np.empty_like(self.timestamp_array)
+        timestamp_array[:keep] = self.timestamp_array[start:self.end]
+        self.timestamp_array = timestamp_array
+        for key, column in self.columns.items():
+            new_column = np.empty_like(column)
+            new_column[:keep] = column[start:self.end]
+            self.columns[key] = new_column
+        self.end = keep
+
+    def _publish(self):
+        start = self.end - self.size
+        timestamps = self.timestamp_array[start:self.end]
+        timestamps.flags.writeable = False
+        columns = {}
+        for key, column in self.columns.items():
+            view = column[start:self.end]
+            view.flags.writeable = False
+            columns[key] = view
+        self.version += 1
+        # a single reference assignment, readers see either the old or the new snapshot
+        self.snapshot = BufferSnapshot(self.version, timestamps, columns, dict(self.labels))
+
+    def timestamps(self, points=None):
+        """Return the timestamps of the latest points (all of them by default)"""
+        timestamps = self.snapshot.timestamps
+        return timestamps if points is None else timestamps[len(timestamps) - min(points, len(timestamps)):]
+
+    def column(self, name, points=None):
+        """Return a metric's latest values"""
+        column = self.snapshot.column(name)
+        return column if points is None else column[len(column) - min(points, len(column)):]
+
+    def has_column(self, name):
+        return self.snapshot.has_column(name)
+
+    def clear(self):
+        with self.write_lock:
+            # fresh arrays, snapshots handed out before keep their data
+            self._reset()
+            self._publish()
+
+    def to_dataframe(self):
+        """Copy the buffer into a DataFrame, mainly for exports and debugging"""
+        snapshot = self.snapshot
+        frame = pd.DataFrame({"timestamp": snapshot.timestamps})
+        for name, column in snapshot.columns.items():
+            frame[name] = column
+        for name, value in snapshot.labels.items():
+            frame[name] = value
+        return frame
+
+
 class MonitoringState:
-    def __init__(self):
+    def __init__(self, buffer_capacity=1000):
         self.current_device = None
         self.monitoring_active = False
         self.monitoring_paused = False
+        self.user_paused = False
+        self.burst_active = False
+        # a comparison of collection methods is switching modes, see compare_collection_methods
+        self.comparison_active = False
         self.monitoring_thread = None
         self.monitoring_interval = 5  
+        self.collection_mode = "top"
+        # "fixed" samples every monitoring_interval, "adaptive" lets the sampler pick the interval
+        self.sampling_mode = "fixed"
+        self.adaptive = AdaptiveSampler()
+        self.stream_restarts = 0
+        self.bytes_transferred = 0
+        self.probe_results = {}
+        self.collector_results = {}
+        self.overhead_comparison = None
+        self.reset_tick_stats()
         self.auto_stopped = False
         self.save_to_local_db = True
-        self.collected_data = pd.DataFrame()
+        self.buffer = MetricRingBuffer(buffer_capacity)
         self.total_points = 0
         self.reconnect_attempts = 0
         self.pause_start_time = None
         self.max_pause_duration = 30 
         self.reconnection_success = False
+        self.reconnection = ReconnectionStateMachine(self)
+
+    @property
+    def effective_interval(self):
+        """The interval the next tick is scheduled with"""
+        if self.sampling_mode == "adaptive" and self.collection_mode != "stream":
+            return self.adaptive.interval
+        return self.monitoring_interval
+
+    def reset_tick_stats(self):
+        """Reset the sampling schedule statistics"""
+        self.ticks_fired = 0
+        self.ticks_skipped = 0
+        self.last_tick_lateness = 0
+        self.max_tick_lateness = 0
+        self.tick_lateness = deque(maxlen=100)
+
+    def record_tick(self, lateness, skipped):
+        """Record how late (in seconds) a scheduled tick fired and how many ticks it skipped"""
+        self.ticks_fired += 1
+        self.ticks_skipped += skipped
+        self.last_tick_lateness = lateness
+        self.max_tick_lateness = max(self.max_tick_lateness, lateness)
+        self.tick_lateness.append(lateness)
+
+    def get_tick_stats(self):
+        """Return a summary of the sampling schedule, to tell whether sampling keeps up"""
+        lateness = list(self.tick_lateness)
+        return {
+            "ticks_fired": self.ticks_fired,
+            "ticks_skipped": self.ticks_skipped,
+            "mean_lateness": sum(lateness) / len(lateness) if lateness else 0,
+            "max_lateness": self.max_tick_lateness,
+            "last_lateness": self.last_tick_lateness,
+        }
 
     def reset_reconnection_state(self):
         """Reset all reconnection-related state variables"""
@@ -278,27 +1389,174 @@ class MonitoringState:
         self.reconnect_attempts = 0
         self.pause_start_time = None
         self.reconnection_success = False
+        self.reconnection.reset()
 
     def reset_monitoring_state(self):
         """Reset monitoring state when stopping monitoring"""
         self.monitoring_active = False
         self.auto_stopped = False
+        self.user_paused = False
+        self.burst_active = False
+        self.comparison_active = False
         self.reset_reconnection_state()
 
     def clear_data(self):
         """Clear collected data"""
-        self.collected_data.drop(self.collected_data.index, inplace=True)
+        self.buffer.clear()
         self.total_points = 0
         logging.info("Data cleared.")
         return True
 
     def add_data_point(self, data):
         """Add a new data point to the collected data"""
-        new_df = pd.DataFrame([data])
-        self.collected_data = pd.concat(
-            [self.collected_data, new_df], ignore_index=True
-        )
+        self.buffer.append(data)
         self.total_points += 1
         logging.debug(f"Added data point {self.total_points}")
-        if len(self.collected_data) > 100:
-            self.collected_data = self.collected_data.iloc[-100:]
+
+    def add_data_points(self, points):
+        """Add a batch of data points, the live data is updated once"""
+        self.buffer.extend(points)
+        self.total_points += len(points)
+
+    @property
+    def collected_data(self):
+        """The buffered data points as a DataFrame (a copy)"""
+        return self.buffer.to_dataframe()
+
+
+class MultiDeviceMonitor:
+    """Monitors several devices at once, each with its own controller, state and buffer.
+
+    Instead of one thread per device, a scheduler thread submits each device's
+    ticks to a bounded worker pool. A device never has more than one tick in
+    flight, so a slow device delays only itself. All devices save through the
+    same database writer.
+    """
+    def __init__(self, max_workers=4):
+        self.max_workers = max_workers
+        self.controllers = {}
+        self.schedulers = {}
+        self.pending = {}
+        # devices whose ticks are currently paced by their top stream
+        self.device_paced = set()
+        self.executor = None
+        self.scheduler_thread = None
+        self.running = False
+        self.lock = threading.Lock()
+        # wakes the scheduler when devices are added or a device reports a change
+        self.wake_event = threading.Event()
+        device_registry.add_listener(lambda *_: self.wake_event.set())
+
+    def add_device(
+        self, serial_number, monitoring_interval=2, collection_mode="top", save_to_local_db=True,
+        sampling_mode="fixed"
+    ):
+        """Start monitoring a device, returns its MonitoringController or None if it can't be set up"""
+        with self.lock:
+            if serial_number in self.controllers:
+                logging.warning(f"Device {serial_number} is already monitored.")
+                return self.controllers[serial_number]
+
+        state = MonitoringState()
+        state.save_to_local_db = save_to_local_db
+        controller = MonitoringController(ConnectionManager(), state)
+        if not controller.prepare_monitoring(
+            f"serial:{serial_number}", monitoring_interval, collection_mode, sampling_mode
+        ):
+            device_registry.remove_listener(controller._on_device_event)
+            return None
+
+        with self.lock:
+            self.controllers[serial_number] = controller
+            controller.scheduler = self.schedulers[serial_number] = TickScheduler(state)
+        self.wake_event.set()
+        logging.info(f"Added device {serial_number} to multi-device monitoring.")
+        return controller
+
+    def remove_device(self, serial_number):
+        with self.lock:
+            controller = self.controllers.pop(serial_number, None)
+            self.schedulers.pop(serial_number, None)
+            self.device_paced.discard(serial_number)
+        if controller:
+            controller.state.reset_monitoring_state()
+            controller.interrupt_collection()
+            device_registry.remove_listener(controller._on_device_event)
+            logging.info(f"Removed device {serial_number} from multi-device monitoring.")
+
+    def get_state(self, serial_number):
+        controller = self.controllers.get(serial_number)
+        return controller.state if controller else None
+
+    def start(self):
+        if self.running:
+            return
+        self.running = True
+        self.executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="monitor")
+        self.scheduler_thread = threading.Thread(target=self._schedule)
+        self.scheduler_thread.daemon = True
+        self.scheduler_thread.start()
+        logging.info(f"Multi-device monitoring started with {self.max_workers} workers.")
+
+    def stop(self):
+        if not self.running:
+            return
+        self.running = False
+        self.wake_event.set()
+        self.scheduler_thread.join(timeout=1.0)
+        for serial_number in list(self.controllers):
+            self.remove_device(serial_number)
+        # ticks still in flight finish on their own, their devices are no longer active
+        self.executor.shutdown(wait=False, cancel_futures=True)
+        logging.info("Multi-device monitoring stopped.")
+
+    def _schedule(self):
+        while self.running:
+            now = time.monotonic()
+            with self.lock:
+                controllers = list(self.controllers.items())
+
+            for serial_number, controller in controllers:
+                if not controller.state.monitoring_active:
+                    # paused for too long and timed out
+                    self.remove_device(serial_number)
+                    continue
+                future = self.pending.get(serial_number)
+                if future and not future.done():
+                    continue
+                scheduler = self.schedulers.get(serial_number)
+                if scheduler is None:
+                    continue
+                reconnection = controller.state.reconnection
+                if controller.state.monitoring_paused:
+                    # reconnecting, the backoff decides when the device is probed
+                    if not (reconnection.is_due(now) or reconnection.timed_out(now)):
+                        continue
+                elif controller.paced_by_device():
+                    self.device_paced.add(serial_number)
+                elif serial_number in self.device_paced:
+                    # the scheduler stood still while the device set the pace, count ticks from now on
+                    self.device_paced.discard(serial_number)
+                    scheduler.reschedule(now=now)
+                    continue
+                elif scheduler.is_due(now):
+                    scheduler.fire(now)
+                else:
+                    # a woken controller waits for its tick as well
+                    continue
+                controller.wake_event.clear()
+                future = self.executor.submit(controller.run_tick)
+                future.add_done_callback(lambda _: self.wake_event.set())
+                self.pending[serial_number] = future
+
+            # devices with a tick in flight wake the scheduler when it completes
+            with self.lock:
+                deadlines = [
+                    now + self.controllers[serial_number].state.reconnection.time_until_probe(now)
+                    if self.controllers[serial_number].state.monitoring_paused else scheduler.deadline
+                    for serial_number, scheduler in self.schedulers.items()
+                    if not (serial_number in self.pending and not self.pending[serial_number].done())
+                ]
+            timeout = max(0, min(deadlines) - time.monotonic()) if deadlines else None
+            self.wake_event.wait(timeout)
+            self.wake_event.clear()